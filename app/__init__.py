@@ -0,0 +1,5 @@
+from dotenv import load_dotenv
+
+# Modules read their settings from the environment when imported, so .env is
+# loaded once here, before any of them.
+load_dotenv()
@@ -1,19 +1,26 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
-from typing import List, Dict, Any
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Query
+from typing import List, Dict, Any, Literal, Optional
 import os
 import uuid
 import json
-from app.services.document_processor import DocumentProcessor
+from app.services.document_processor import DocumentProcessor, ExtractionError
 from app.services.llm_extractor import LLMExtractor
 from app.services.search_engine import SearchEngine
 from app.services.chatbot_service import ChatbotService
-from app.utils.helpers import ensure_dir
-from app.database import get_db, Document
-from app.models.schemas import ChatQuery, ChatResponse, DocumentResponse, ProcessingStatus
+from app.services.embeddings import encode_texts, is_model_loaded, pool_vectors, resolve_model_name
+from app.services.document_listing import export_csv, export_ndjson, iter_outputs, list_documents
+from app.services.job_queue import JobQueue
+from app.services import metrics
+from app.services.pre_classifier import PreClassifier
+from app.utils.helpers import ensure_dir, save_upload, text_fingerprint
+from app.database import db_writer, get_db, Document, DocumentChunk, ProcessingJob
+from app.models.schemas import ChatQuery, ChatResponse, DocumentPage, DocumentResponse, ProcessingStatus, SearchResult
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from fastapi import Depends
 import asyncio
 from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
 router = APIRouter()
 
@@ -25,87 +32,217 @@ ensure_dir(OUTPUTS_DIR)
 processor = DocumentProcessor()
 llm_extractor = LLMExtractor(model_name=os.getenv("OLLAMA_MODEL"))
 search_engine = SearchEngine()
-chatbot = ChatbotService(model_name=os.getenv("OLLAMA_MODEL"))
+chatbot = ChatbotService(model_name=os.getenv("OLLAMA_MODEL"), search_engine=search_engine)
+pre_classifier = PreClassifier()
+
+# Startup work the app's lifespan runs after it starts serving; the worker
+# is live right away and ready once all of these are done.
+readiness = {"embedding_model": False}
 
 processing_results = {}
 processing_status = {}
 
+def _find_documents(db: Session, column, values) -> Dict[str, Document]:
+    if not values:
+        return {}
+    return {getattr(doc, column.key): doc for doc in db.query(Document).filter(column.in_(values))}
+
 @router.post("/documents/upload")
 async def upload_documents(files: List[UploadFile] = File(...), db: Session = Depends(get_db)):
-    uploaded_files = []
-    processing_tasks = []
-    
+    embedding_model = resolve_model_name(search_engine.model_name)
+    saved = []
     for file in files:
-        file_path = os.path.join(UPLOADS_DIR, file.filename)
-        content_bytes = await file.read()
+        upload_id = uuid.uuid4()
+        part_path = os.path.join(UPLOADS_DIR, f".{upload_id}.part")
+        with metrics.timed("upload_save"):
+            content_hash = await save_upload(file, part_path)
+        saved.append((os.path.basename(file.filename), upload_id, part_path, content_hash))
 
-        with open(file_path, "wb") as f:
-            f.write(content_bytes)
+    # No query runs on the event loop: while another connection holds the
+    # SQLite write lock, a statement can wait up to SQLITE_BUSY_TIMEOUT_MS.
+    # Byte-identical re-uploads reuse the stored document without parsing.
+    stored = await run_in_threadpool(
+        _find_documents, db, Document.content_hash, {content_hash for *_, content_hash in saved}
+    )
 
-        text = processor.extract_text(file_path)
-        clean_text = processor.clean_text(text) if text else ""
-        
-        embedding = None
-        if clean_text:
-            embedding = search_engine.model.encode(clean_text).tolist()
-
-        db_doc = Document(
-            document_name=file.filename,
-            content=clean_text,
-            vector_embeddings=embedding
+    uploaded_files = [None] * len(files)
+    new_files = {}
+    for i, (filename, upload_id, part_path, content_hash) in enumerate(saved):
+        if content_hash in stored or content_hash in new_files:
+            os.remove(part_path)
+            if content_hash in stored:
+                uploaded_files[i] = stored[content_hash]
+            else:
+                new_files[content_hash][2].append(i)
+            continue
+
+        # Stored under a unique name: files sharing a name, in this request
+        # or a concurrent one, must not overwrite each other before parsing.
+        file_path = os.path.join(UPLOADS_DIR, f"{upload_id}_{filename}")
+        os.replace(part_path, file_path)
+        new_files[content_hash] = (filename, file_path, [i])
+
+    # All new files are parsed in one call so the PDF worker pool can spread
+    # separate files and the pages of large ones across cores.
+    try:
+        texts = await run_in_threadpool(
+            processor.extract_texts, [file_path for _, file_path, _ in new_files.values()]
         )
-        db.add(db_doc)
-        db.commit()
-        db.refresh(db_doc)
-        uploaded_files.append(db_doc)
+    except ExtractionError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
 
-        job_id = str(uuid.uuid4())
-        processing_tasks.append(run_in_threadpool(run_processing_job_v2, job_id, db_doc.id))
+    cleaned = [processor.clean_text(text) if text else "" for text in texts]
+    # Same text in a different file (re-exported PDF, another mailbox).
+    same_text = await run_in_threadpool(
+        _find_documents, db, Document.text_hash, {text_fingerprint(text) for text in cleaned if text}
+    )
 
-    if processing_tasks:
-        await asyncio.gather(*processing_tasks)
-    
-    final_response_files = []
-    for f in uploaded_files:
-        db.refresh(f)
-        final_response_files.append(DocumentResponse.model_validate(f))
+    new_docs = []
+    for (content_hash, (filename, _, indexes)), clean_text in zip(new_files.items(), cleaned):
+        text_hash = text_fingerprint(clean_text)
+        db_doc = same_text.get(text_hash) if clean_text else None
+        if db_doc is None:
+            db_doc = Document(
+                id=str(uuid.uuid4()),
+                document_name=filename,
+                content=clean_text,
+                content_hash=content_hash,
+                text_hash=text_hash,
+            )
+            new_docs.append(db_doc)
+            if clean_text:
+                same_text[text_hash] = db_doc
+        for i in indexes:
+            uploaded_files[i] = db_doc
+
+    unique_docs = list({db_doc.id: db_doc for db_doc in uploaded_files}.values())
+
+    # Long documents are embedded chunk by chunk, all in one batched forward
+    # pass for the whole request instead of one per file. Documents whose
+    # stored vectors came from the current model are skipped.
+    to_embed = [d for d in unique_docs if d.content and d.embedding_model != embedding_model]
+    chunked = [processor.chunk_text(db_doc.content) for db_doc in to_embed]
+    vectors = await run_in_threadpool(encode_texts, [chunk for chunks in chunked for chunk in chunks])
+
+    embedded = {}
+    offset = 0
+    for db_doc, chunks in zip(to_embed, chunked):
+        chunk_vectors = vectors[offset:offset + len(chunks)]
+        offset += len(chunks)
+        embedded[db_doc.id] = (pool_vectors(chunk_vectors), chunks, chunk_vectors)
 
-    return {"message": f"{len(uploaded_files)} files uploaded and processed successfully", "files": final_response_files}
+    # Rows, embeddings and jobs are written through the shared writer thread,
+    # in one transaction, so uploads queue behind other writes instead of
+    # competing with them for the lock. Extraction runs in the job queue
+    # workers; documents already extracted with the current prompt are not
+    # queued again.
+    def store(writer_db: Session) -> Dict[str, Any]:
+        writer_db.add_all(new_docs)
+        docs = {db_doc.id: db_doc for db_doc in new_docs}
+        for db_doc in unique_docs:
+            if db_doc.id not in docs:
+                docs[db_doc.id] = writer_db.get(Document, db_doc.id)
 
-def run_processing_job_v2(job_id: str, doc_id: str):
+        for doc_id, (pooled, chunks, chunk_vectors) in embedded.items():
+            db_doc = docs[doc_id]
+            db_doc.vector_embeddings = pooled.tobytes()
+            db_doc.chunks = [
+                DocumentChunk(chunk_index=i, content=chunk, vector_embeddings=vector.tobytes())
+                for i, (chunk, vector) in enumerate(zip(chunks, chunk_vectors))
+            ]
+            db_doc.embedding_model = embedding_model
+        writer_db.flush()
+
+        jobs = [
+            job_queue.enqueue(writer_db, db_doc.id)
+            for db_doc in docs.values()
+            if db_doc.processed_output is None or db_doc.prompt_version != llm_extractor.prompt_version
+        ]
+        writer_db.flush()
+        return {
+            "message": f"{len(uploaded_files)} files uploaded, {len(jobs)} queued for processing",
+            "files": [DocumentResponse.model_validate(docs[db_doc.id]) for db_doc in uploaded_files],
+            "jobs": [{"job_id": job.id, "document_id": job.document_id} for job in jobs],
+        }
+
+    with metrics.timed("upload_commit"):
+        response = await db_writer.run_async(store)
+    job_queue.notify()
+
+    return response
+
+async def process_documents(doc_ids: List[str]) -> Dict[str, Exception]:
     db = next(get_db())
     try:
-        doc = db.query(Document).filter(Document.id == doc_id).first()
-        if not doc:
-            raise HTTPException(status_code=404, detail="Document not found")
-        
-        if not doc.content:
-            doc.processed_output = {"class": "Unclassifiable", "error": "No content"}
-            db.commit()
-            processing_status[job_id] = {"status": "complete"}
-            raise HTTPException(status_code=400, detail="No content found for document")
-
-        extracted_data = llm_extractor.extract(doc.content, "Unknown")
-        final_class = extracted_data.get("document_type", "Processed")
-        
-        result = {"class": final_class, **extracted_data}
-        doc.processed_output = result
-        db.commit()
+        docs = await run_in_threadpool(
+            lambda: db.query(Document).filter(Document.id.in_(doc_ids)).all()
+        )
+        await run_in_threadpool(pre_classifier.refresh)
 
-        processing_status[job_id] = {"status": "complete", "progress": 100}
-        
-    except Exception as e:
-        processing_status[job_id] = {"status": "error", "error": str(e)}
-        raise HTTPException(status_code=500, detail=str(e))
+        # Documents the pre-classifier is sure about skip the classification
+        # prompt: "Other" needs no LLM call at all, the rest get a short prompt
+        # for their one schema.
+        predicted = {}
+        for doc in docs:
+            if doc.content and doc.embedding_model == resolve_model_name(search_engine.model_name):
+                doc_class = pre_classifier.predict(doc.vector_embeddings)
+                if doc_class:
+                    predicted[doc.id] = doc_class
+
+        async def extract_typed(doc: Document):
+            try:
+                return doc.id, await llm_extractor.extract(doc.content, predicted[doc.id])
+            except Exception as e:
+                return doc.id, e
+
+        typed, extracted = await asyncio.gather(
+            asyncio.gather(*(
+                extract_typed(doc) for doc in docs
+                if predicted.get(doc.id) not in (None, "Other")
+            )),
+            llm_extractor.extract_many(
+                [(doc.id, doc.content) for doc in docs if doc.content and doc.id not in predicted]
+            ),
+        )
+        extracted.update(typed)
+
+        failures = {}
+        updates = []
+        for doc in docs:
+            if not doc.content:
+                result = {"class": "Unclassifiable", "error": "No content"}
+            elif predicted.get(doc.id) == "Other":
+                result = {
+                    "class": "Other",
+                    "summary": " ".join(doc.content.split()[:50]),
+                    "document_type": "Other",
+                    "classified_by": "local",
+                }
+            elif isinstance(extracted.get(doc.id), Exception):
+                failures[doc.id] = extracted[doc.id]
+                continue
+            else:
+                extracted_data = extracted[doc.id]
+                final_class = extracted_data.get("document_type", "Processed")
+                result = {"class": final_class, **extracted_data}
+                if doc.id in predicted:
+                    result["classified_by"] = "local"
+
+            updates.append({"id": doc.id, "processed_output": result, "prompt_version": llm_extractor.prompt_version})
     finally:
         db.close()
 
+    if updates:
+        await db_writer.run_async(lambda writer_db: writer_db.execute(update(Document), updates))
+    return failures
+
+job_queue = JobQueue(handler=process_documents, batch_size=llm_extractor.batch_size)
+
 async def run_processing_job(job_id: str):
     files = [f for f in os.listdir(UPLOADS_DIR) if os.path.isfile(os.path.join(UPLOADS_DIR, f))]
     total_files = len(files)
     
     results = {}
-    docs_for_search = []
     
     for i, filename in enumerate(files):
         file_path = os.path.join(UPLOADS_DIR, filename)
@@ -120,25 +257,17 @@ async def run_processing_job(job_id: str):
             clean_text = processor.clean_text(text)
 
             doc_class = "Unknown"
-            extracted_data = llm_extractor.extract(clean_text, doc_class)
+            extracted_data = await llm_extractor.extract(clean_text, doc_class)
             
             final_class = extracted_data.get("document_type", "Processed")
             
             result = {"class": final_class, **extracted_data}
             results[filename] = result
             
-            docs_for_search.append({
-                "filename": filename,
-                "text": clean_text,
-                "metadata": result
-            })
-            
         except Exception as e:
             results[filename] = {"class": "Error", "error": str(e)}
             raise HTTPException(status_code=500, detail=str(e))
 
-    search_engine.index_documents(docs_for_search)
-
     output_path = os.path.join(OUTPUTS_DIR, "results.json")
     with open(output_path, "w") as f:
         json.dump(results, f, indent=2)
@@ -148,23 +277,115 @@ async def run_processing_job(job_id: str):
     
     processing_status[job_id] = {"status": "complete", "progress": 100, "current_file": ""}
 
-@router.get("/documents/status/{job_id}")
-async def get_status(job_id: str):
-    if job_id not in processing_status:
-        return {"status": "unknown"}
-    return processing_status[job_id]
+@router.get("/documents", response_model=DocumentPage)
+async def get_documents(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    doc_class: Optional[str] = Query(None, alias="class"),
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    fields: Optional[List[str]] = Query(None),
+    db: Session = Depends(get_db),
+):
+    # fields selects the columns returned (id is always included); content
+    # and vector_embeddings are left out unless named.
+    try:
+        items, next_cursor = await run_in_threadpool(
+            list_documents, db, fields, limit, cursor, doc_class, date_from, date_to
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return DocumentPage(items=items, next_cursor=next_cursor)
+
+@router.get("/documents/export")
+async def export_documents(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    doc_class: Optional[str] = Query(None, alias="class"),
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+):
+    rows = iter_outputs(doc_class, date_from, date_to)
+    if format == "csv":
+        return StreamingResponse(
+            export_csv(rows),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="documents.csv"'},
+        )
+    return StreamingResponse(export_ndjson(rows), media_type="application/x-ndjson")
+
+@router.get("/documents/search", response_model=List[SearchResult])
+async def search_documents(
+    q: str,
+    k: int = Query(5, ge=1, le=100),
+    mode: Literal["vector", "keyword", "hybrid"] = "vector",
+    db: Session = Depends(get_db),
+):
+    search = {
+        "vector": search_engine.search_index,
+        "keyword": search_engine.keyword_search,
+        "hybrid": search_engine.hybrid_search,
+    }[mode]
+    return await run_in_threadpool(search, q, db, k)
+
+@router.get("/documents/status/{job_id}", response_model=ProcessingStatus)
+async def get_status(job_id: str, db: Session = Depends(get_db)):
+    job = db.get(ProcessingJob, job_id)
+    if not job:
+        return ProcessingStatus(job_id=job_id, status="unknown")
+    return ProcessingStatus(
+        job_id=job.id,
+        document_id=job.document_id,
+        status=job.status,
+        progress=100 if job.status == "complete" else 0,
+        attempts=job.attempts,
+        error=job.error,
+    )
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat(query_data: ChatQuery, db: Session = Depends(get_db)):
-    response = chatbot.chat(query_data.query, db)
+    response = await chatbot.chat(query_data.query, db)
     return ChatResponse(response=response)
 
+@router.post("/chat/stream")
+async def chat_stream(query_data: ChatQuery, db: Session = Depends(get_db)):
+    # Retrieval happens before streaming starts so the session is not used
+    # after the response has begun.
+    found, answer, key = await run_in_threadpool(chatbot.lookup, query_data.query, db)
+    prompt = None
+    if not found:
+        answer, prompt = await run_in_threadpool(chatbot.prepare, query_data.query, db, key.vector)
+    else:
+        key = None
+
+    async def ndjson():
+        async for event in chatbot.stream(prompt, answer, key):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus text exposition format.
+    return PlainTextResponse(await run_in_threadpool(metrics.render), media_type="text/plain; version=0.0.4")
+
 @router.get("/health")
 async def health_check():
+    # Liveness: answers as soon as the worker serves requests. "ready" says
+    # whether startup has finished loading the models.
     return {
         "status": "healthy",
+        "ready": all(readiness.values()),
+        "startup": readiness,
         "models_loaded": {
-            "search": search_engine.model is not None,
+            "search": is_model_loaded(search_engine.model_name),
             "chatbot": chatbot.model_name is not None
-        }
+        },
+        "chat_cache": chatbot.cache.stats(),
     }
+
+@router.get("/health/ready")
+async def readiness_check():
+    # For load balancer and orchestrator readiness probes: 503 until startup
+    # has finished.
+    ready = all(readiness.values())
+    return JSONResponse({"ready": ready, "startup": readiness}, status_code=200 if ready else 503)
@@ -1,39 +1,335 @@
+import asyncio
 import os
+import queue
+import threading
+import time
 import uuid
 import struct
-from sqlalchemy import create_engine, Column, String, Text, JSON, event
+from concurrent.futures import Future
+from datetime import datetime
+from sqlalchemy import create_engine, Column, String, Text, JSON, LargeBinary, Integer, DateTime, ForeignKey, event, text, func, literal_column
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.types import TypeDecorator
 import sqlite_vec
-from typing import List
-
-from dotenv import load_dotenv
-load_dotenv()
+from app.services.metrics import Gauge, Histogram
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./solvify.db")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "384"))
+# How many chunk neighbours to fetch per requested document, since several
+# chunks of the same document can crowd the top of the list.
+CHUNK_SEARCH_FANOUT = int(os.getenv("CHUNK_SEARCH_FANOUT", "5"))
+
+# Connection settings applied to every new SQLite connection. WAL lets
+# readers run alongside the single writer, and synchronous=NORMAL is durable
+# in WAL mode except against power loss. busy_timeout makes a connection wait
+# for the write lock instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # Negative values are KiB rather than pages.
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024))) * -1,
+    "temp_store": "MEMORY",
+}
+
+def make_engine(url: str = DATABASE_URL, pragmas: Optional[Dict[str, Any]] = SQLITE_PRAGMAS):
+    # Request threads, job workers and the writer thread each hold a
+    # connection at times, so the pool is sized for them explicitly. In-memory
+    # databases keep SQLAlchemy's one-connection-per-thread pool.
+    pool_args = {}
+    if make_url(url).database not in (None, "", ":memory:"):
+        pool_args = {
+            "pool_size": int(os.getenv("DB_POOL_SIZE", "20")),
+            "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+            "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        }
+    engine = create_engine(url, connect_args={"check_same_thread": False}, **pool_args)
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    @event.listens_for(engine, "connect")
+    def load_vec_extension(dbapi_connection, connection_record):
+        dbapi_connection.enable_load_extension(True)
+        sqlite_vec.load(dbapi_connection)
+        dbapi_connection.enable_load_extension(False)
 
-@event.listens_for(engine, "connect")
-def load_vec_extension(dbapi_connection, connection_record):
-    dbapi_connection.enable_load_extension(True)
-    sqlite_vec.load(dbapi_connection)
-    dbapi_connection.enable_load_extension(False)
+        cursor = dbapi_connection.cursor()
+        for name, value in (pragmas or {}).items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    return engine
+
+engine = make_engine()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+class Vector(TypeDecorator):
+    # float32 blob, the same layout vec0 expects
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, bytes):
+            return value
+        return serialize_vector(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return deserialize_vector(value)
+
 class Document(Base):
     __tablename__ = "documents"
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     document_name = Column(String, index=True)
     content = Column(Text)
-    vector_embeddings = Column(JSON, nullable=True) 
+    vector_embeddings = Column(Vector, nullable=True)
     processed_output = Column(JSON, nullable=True)
+    # sha256 of the uploaded bytes and of the whitespace-normalized text, used
+    # to recognise re-uploads, plus what produced the stored embedding and
+    # processed_output so stale results are recomputed.
+    content_hash = Column(String, index=True, nullable=True)
+    text_hash = Column(String, index=True, nullable=True)
+    embedding_model = Column(String, nullable=True)
+    prompt_version = Column(String, nullable=True)
+
+    chunks = relationship(
+        "DocumentChunk",
+        back_populates="document",
+        cascade="all, delete-orphan",
+        order_by="DocumentChunk.chunk_index",
+    )
+
+class DocumentChunk(Base):
+    __tablename__ = "document_chunks"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    document_id = Column(String, ForeignKey("documents.id", ondelete="CASCADE"), index=True, nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    content = Column(Text)
+    vector_embeddings = Column(Vector, nullable=True)
+
+    document = relationship("Document", back_populates="chunks")
+
+class ProcessingJob(Base):
+    __tablename__ = "processing_jobs"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    document_id = Column(String, ForeignKey("documents.id", ondelete="CASCADE"), index=True, nullable=False)
+    # queued -> running -> complete | error (running goes back to queued on retry)
+    status = Column(String, index=True, nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_cache"
+
+    model = Column(String, primary_key=True)
+    prompt_hash = Column(String, primary_key=True)
+    response = Column(Text, nullable=False)
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_used_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+# Single row counting changes to documents. Triggers bump it on every insert,
+# update and delete, from any process or raw SQL, so anything derived from the
+# corpus (the chat answer cache) can tell when it is out of date.
+class CorpusVersion(Base):
+    __tablename__ = "corpus_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+CORPUS_VERSION_DDL = [
+    "INSERT OR IGNORE INTO corpus_version(id, version) VALUES (1, 0)",
+    """
+    CREATE TRIGGER IF NOT EXISTS documents_version_ai AFTER INSERT ON documents
+    BEGIN
+        UPDATE corpus_version SET version = version + 1 WHERE id = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS documents_version_au AFTER UPDATE ON documents
+    BEGIN
+        UPDATE corpus_version SET version = version + 1 WHERE id = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS documents_version_ad AFTER DELETE ON documents
+    BEGIN
+        UPDATE corpus_version SET version = version + 1 WHERE id = 1;
+    END
+    """,
+]
+
+# document_vectors mirrors documents.vector_embeddings through triggers, so
+# ORM writes and raw SQL both keep the KNN index current.
+VECTOR_INDEX_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS document_vectors USING vec0(
+        document_id TEXT PRIMARY KEY,
+        embedding FLOAT[{EMBEDDING_DIM}] distance_metric=cosine
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS documents_vectors_ai AFTER INSERT ON documents
+    WHEN new.vector_embeddings IS NOT NULL
+    BEGIN
+        INSERT INTO document_vectors(document_id, embedding) VALUES (new.id, new.vector_embeddings);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS documents_vectors_au AFTER UPDATE OF vector_embeddings ON documents
+    BEGIN
+        DELETE FROM document_vectors WHERE document_id = old.id;
+        INSERT INTO document_vectors(document_id, embedding)
+        SELECT new.id, new.vector_embeddings WHERE new.vector_embeddings IS NOT NULL;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS documents_vectors_ad AFTER DELETE ON documents
+    BEGIN
+        DELETE FROM document_vectors WHERE document_id = old.id;
+        DELETE FROM document_chunks WHERE document_id = old.id;
+    END
+    """,
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS chunk_vectors USING vec0(
+        embedding FLOAT[{EMBEDDING_DIM}] distance_metric=cosine
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS document_chunks_vectors_ai AFTER INSERT ON document_chunks
+    WHEN new.vector_embeddings IS NOT NULL
+    BEGIN
+        INSERT INTO chunk_vectors(rowid, embedding) VALUES (new.id, new.vector_embeddings);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS document_chunks_vectors_au AFTER UPDATE OF vector_embeddings ON document_chunks
+    BEGIN
+        DELETE FROM chunk_vectors WHERE rowid = old.id;
+        INSERT INTO chunk_vectors(rowid, embedding)
+        SELECT new.id, new.vector_embeddings WHERE new.vector_embeddings IS NOT NULL;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS document_chunks_vectors_ad AFTER DELETE ON document_chunks
+    BEGIN
+        DELETE FROM chunk_vectors WHERE rowid = old.id;
+    END
+    """,
+]
+
+# Full-text index over document names and text for keyword lookups (invoice
+# and account numbers, names). Keyed by document id rather than rowid, which
+# VACUUM may renumber on a table without an INTEGER PRIMARY KEY.
+FULLTEXT_INDEX_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS document_fts USING fts5(
+        document_id UNINDEXED,
+        document_name,
+        content,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS documents_fts_ai AFTER INSERT ON documents
+    BEGIN
+        INSERT INTO document_fts(document_id, document_name, content)
+        VALUES (new.id, new.document_name, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS documents_fts_au AFTER UPDATE OF document_name, content ON documents
+    BEGIN
+        DELETE FROM document_fts WHERE document_id = old.id;
+        INSERT INTO document_fts(document_id, document_name, content)
+        VALUES (new.id, new.document_name, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS documents_fts_ad AFTER DELETE ON documents
+    BEGIN
+        DELETE FROM document_fts WHERE document_id = old.id;
+    END
+    """,
+]
+
+# bm25() weights for document_name and content; a hit in the file name
+# counts for more than one in the body. bm25() takes one weight per column,
+# so fts_search passes 0.0 for the UNINDEXED document_id ahead of these.
+FULLTEXT_WEIGHTS = (2.0, 1.0)
+
+# processed_output fields the chat query planner and document listing filter on. Each gets an
+# expression index; output_field() renders the identical expression so
+# SQLite can use it.
+INDEXED_OUTPUT_FIELDS = ["document_type", "date", "company", "class"]
+
+def output_field(name: str):
+    return func.json_extract(Document.processed_output, literal_column(f"'$.{name}'"))
+
+def _add_missing_columns(conn):
+    # create_all only creates missing tables; columns and indexes added to an
+    # existing model are applied here.
+    for table in Base.metadata.sorted_tables:
+        existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table.name})")}
+        for column in table.columns:
+            if column.name not in existing:
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"
+                )
+        for index in table.indexes:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+# The only embedding model the app used before documents recorded theirs.
+LEGACY_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        _add_missing_columns(conn)
+        for ddl in VECTOR_INDEX_DDL + FULLTEXT_INDEX_DDL + CORPUS_VERSION_DDL:
+            conn.exec_driver_sql(ddl)
+        for name in INDEXED_OUTPUT_FIELDS:
+            conn.exec_driver_sql(
+                f"CREATE INDEX IF NOT EXISTS ix_documents_output_{name} "
+                f"ON documents (json_extract(processed_output, '$.{name}'))"
+            )
+        # Older rows stored embeddings as JSON text; convert them to float32
+        # blobs (the update trigger indexes them as it goes).
+        conn.exec_driver_sql(
+            "UPDATE documents SET vector_embeddings = CASE vector_embeddings "
+            "WHEN 'null' THEN NULL ELSE vec_f32(vector_embeddings) END "
+            "WHERE typeof(vector_embeddings) = 'text'"
+        )
+        # Vectors written before embedding_model existed all came from the
+        # model the app then hard-coded; record it so they stay usable.
+        conn.exec_driver_sql(
+            "UPDATE documents SET embedding_model = ? "
+            "WHERE embedding_model IS NULL AND vector_embeddings IS NOT NULL",
+            (LEGACY_EMBEDDING_MODEL,),
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO document_vectors(document_id, embedding) "
+            "SELECT id, vector_embeddings FROM documents "
+            "WHERE vector_embeddings IS NOT NULL "
+            "AND id NOT IN (SELECT document_id FROM document_vectors)"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO document_fts(document_id, document_name, content) "
+            "SELECT id, document_name, content FROM documents "
+            "WHERE id NOT IN (SELECT document_id FROM document_fts)"
+        )
 
 def get_db():
     db = SessionLocal()
@@ -42,5 +338,155 @@ def get_db():
     finally:
         db.close()
 
+T = TypeVar("T")
+
+# SQLite allows one writer at a time; concurrent committers otherwise queue up
+# on the file lock, sleeping in the busy handler. Background writes (job
+# state, extraction results, cache bookkeeping) are instead submitted here and
+# run one after another on a single thread. Writes that queue up while one is
+# running are group-committed: each runs in its own savepoint, so a failing
+# function only rolls back itself, and the group shares one commit (and one
+# fsync). A function's future resolves once its changes are committed.
+class DatabaseWriter:
+    def __init__(self, session_factory: Callable[[], Any] = SessionLocal, max_batch: int = None):
+        self.session_factory = session_factory
+        self.max_batch = max_batch or int(os.getenv("DB_WRITER_BATCH", "64"))
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[[Any], T]) -> "Future[T]":
+        future: Future = Future()
+        if threading.current_thread() is self._thread:
+            # Already on the writer thread; queueing would deadlock.
+            self._execute([(fn, future)])
+            return future
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="db-writer", daemon=True)
+                self._thread.start()
+        self._queue.put((fn, future))
+        return future
+
+    def run(self, fn: Callable[[Any], T]) -> T:
+        return self.submit(fn).result()
+
+    async def run_async(self, fn: Callable[[Any], T]) -> T:
+        return await asyncio.wrap_future(self.submit(fn))
+
+    def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            batch = []
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.max_batch:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._execute(batch)
+            if item is None:
+                return
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _execute(self, batch: List[Tuple[Callable[[Any], Any], Future]]):
+        started = time.perf_counter()
+        batch = [(fn, future) for fn, future in batch if future.set_running_or_notify_cancel()]
+        results = []
+        db = self.session_factory()
+        try:
+            for fn, future in batch:
+                try:
+                    if len(batch) == 1:
+                        results.append((future, fn(db)))
+                    else:
+                        with db.begin_nested():
+                            results.append((future, fn(db)))
+                except BaseException as e:
+                    if len(batch) == 1:
+                        db.rollback()
+                    future.set_exception(e)
+            db.commit()
+        except BaseException as e:
+            db.rollback()
+            for future, _ in results:
+                future.set_exception(e)
+            return
+        finally:
+            db.close()
+        DB_WRITE_SECONDS.observe(time.perf_counter() - started)
+        DB_WRITE_BATCH.observe(len(batch))
+        for future, result in results:
+            future.set_result(result)
+
+db_writer = DatabaseWriter()
+
+DB_WRITE_SECONDS = Histogram("docproc_db_write_seconds", "Time to run and commit one group of queued writes.")
+DB_WRITE_BATCH = Histogram(
+    "docproc_db_write_batch_size", "Writes per group commit.", buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+Gauge("docproc_db_writer_pending", "Writes waiting for the database writer thread.", fn=db_writer.pending)
+
 def serialize_vector(vector: List[float]) -> bytes:
     return struct.pack(f"{len(vector)}f", *vector)
+
+def deserialize_vector(blob: bytes) -> List[float]:
+    return list(struct.unpack(f"{len(blob) // 4}f", blob))
+
+def knn_search(db, vector: List[float], k: int = 5) -> List[Tuple[str, float]]:
+    # A document's distance is that of its closest chunk, or of its
+    # whole-document vector for rows stored before chunking existed.
+    rows = db.execute(
+        text(
+            "SELECT document_id, MIN(distance) AS distance FROM ("
+            "  SELECT c.document_id, v.distance FROM ("
+            "    SELECT rowid, distance FROM chunk_vectors"
+            "    WHERE embedding MATCH :vector AND k = :fetch_k"
+            "  ) v JOIN document_chunks c ON c.id = v.rowid"
+            "  UNION ALL"
+            "  SELECT document_id, distance FROM document_vectors"
+            "  WHERE embedding MATCH :vector AND k = :k"
+            ") GROUP BY document_id ORDER BY distance LIMIT :k"
+        ),
+        {"vector": serialize_vector(vector), "k": k, "fetch_k": min(k * CHUNK_SEARCH_FANOUT, 4096)},
+    ).all()
+    return [(row.document_id, row.distance) for row in rows]
+
+def corpus_version(db) -> int:
+    return db.execute(text("SELECT version FROM corpus_version WHERE id = 1")).scalar() or 0
+
+def fts_query(query: str) -> str:
+    # Each whitespace-separated term becomes a quoted phrase, so user input
+    # cannot inject FTS5 syntax and "INV-2024-001" still has to match its
+    # parts in order. Terms are OR-ed and bm25 ranks documents matching more
+    # of them first.
+    terms = ['"' + term.replace('"', '""') + '"' for term in query.split()]
+    return " OR ".join(terms)
+
+def fts_search(db, query: str, k: int = 5) -> List[Tuple[str, float]]:
+    # Returns (document_id, bm25) pairs, best first; bm25 is lower for
+    # better matches.
+    match = fts_query(query)
+    if not match:
+        return []
+    rows = db.execute(
+        text(
+            "SELECT document_id, bm25(document_fts, 0.0, :name_weight, :content_weight) AS rank "
+            "FROM document_fts WHERE document_fts MATCH :match ORDER BY rank LIMIT :k"
+        ),
+        {"match": match, "k": k, "name_weight": FULLTEXT_WEIGHTS[0], "content_weight": FULLTEXT_WEIGHTS[1]},
+    ).all()
+    return [(row.document_id, row.rank) for row in rows]
@@ -0,0 +1,296 @@
+"""Bulk-load a directory or zip archive of documents into the database.
+
+    python -m app.ingest path/to/dir
+    python -m app.ingest archive.zip --batch-size 64 --commit-every 2000
+
+Files go through hash -> extract -> embed -> write stages, each in its own
+thread and joined by bounded queues, so parsing, embedding and inserts
+overlap without the whole corpus being held in memory. Rows are written with
+executemany in large transactions. Files whose bytes or text are already
+stored are skipped, so an interrupted run can simply be started again.
+Extraction jobs are queued for the API's workers unless --no-extract is given.
+"""
+import argparse
+import hashlib
+import os
+import queue
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from datetime import datetime
+from typing import Callable, Iterator, List, Optional, Tuple
+from sqlalchemy import insert
+from app.database import Document, DocumentChunk, ProcessingJob, SessionLocal, init_db
+from app.services.document_processor import DocumentProcessor
+from app.services.embeddings import encode_texts, pool_vectors, resolve_model_name
+from app.utils.helpers import get_all_files, text_fingerprint, UPLOAD_CHUNK_SIZE
+
+EXTENSIONS = [".pdf", ".txt"]
+
+# Marks the end of a stage's output.
+_DONE = object()
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def iter_source(source: str, workdir: str) -> Iterator[Tuple[str, str]]:
+    # Yields (document_name, path) pairs. Zip members are unpacked one at a
+    # time into workdir as they are reached.
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for member in archive.infolist():
+                if member.is_dir() or not any(member.filename.lower().endswith(ext) for ext in EXTENSIONS):
+                    continue
+                yield os.path.basename(member.filename), archive.extract(member, workdir)
+    else:
+        for path in sorted(get_all_files(source, EXTENSIONS)):
+            yield os.path.basename(path), path
+
+
+class Pipeline:
+    def __init__(
+        self,
+        source: str,
+        batch_size: int = 32,
+        commit_every: int = 1000,
+        queue_size: int = 4,
+        extract: bool = True,
+        processor: DocumentProcessor = None,
+    ):
+        self.source = source
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        self.queue_size = queue_size
+        self.extract = extract
+        self.processor = processor or DocumentProcessor()
+        self.embedding_model = resolve_model_name()
+
+        # Each counter is only updated by one stage.
+        self.stats = {"seen": 0, "skipped": 0, "duplicates": 0, "failed": 0, "inserted": 0}
+        self._error: Optional[BaseException] = None
+        self._stop = threading.Event()
+
+    def run(self) -> dict:
+        db = SessionLocal()
+        try:
+            # Everything already stored, for resuming and de-duplication.
+            self._content_hashes = {h for (h,) in db.query(Document.content_hash) if h}
+            self._text_hashes = {h for (h,) in db.query(Document.text_hash) if h}
+        finally:
+            db.close()
+
+        started = time.perf_counter()
+        with tempfile.TemporaryDirectory() as workdir:
+            self._workdir = workdir
+            hashed = queue.Queue(self.queue_size)
+            extracted = queue.Queue(self.queue_size)
+            embedded = queue.Queue(self.queue_size)
+            threads = [
+                threading.Thread(target=self._guard, args=(self._read, workdir, hashed), daemon=True),
+                threading.Thread(target=self._guard, args=(self._map, self._extract_batch, hashed, extracted), daemon=True),
+                threading.Thread(target=self._guard, args=(self._map, self._embed_batch, extracted, embedded), daemon=True),
+            ]
+            for thread in threads:
+                thread.start()
+            try:
+                self._write(embedded)
+            finally:
+                self._stop.set()
+                for thread in threads:
+                    thread.join()
+                self.processor.close()
+
+        if self._error is not None:
+            raise self._error
+        self.stats["seconds"] = round(time.perf_counter() - started, 2)
+        return self.stats
+
+    def _guard(self, stage: Callable, *args):
+        # Records the first failure so run() can re-raise it, and makes sure
+        # the next stage still sees the end of the stream.
+        outbox = args[-1]
+        try:
+            stage(*args)
+        except BaseException as e:
+            if self._error is None:
+                self._error = e
+            self._stop.set()
+            self._put(outbox, _DONE)
+
+    def _put(self, outbox: queue.Queue, item) -> bool:
+        # Blocks while the next stage is behind, unless the run is stopping.
+        while True:
+            try:
+                outbox.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                if self._stop.is_set():
+                    return False
+
+    def _get(self, inbox: queue.Queue):
+        while True:
+            try:
+                return inbox.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return _DONE
+
+    def _read(self, workdir: str, outbox: queue.Queue):
+        batch = []
+        for name, path in iter_source(self.source, workdir):
+            if self._stop.is_set():
+                break
+            self.stats["seen"] += 1
+            content_hash = file_hash(path)
+            if content_hash in self._content_hashes:
+                self.stats["skipped"] += 1
+                continue
+            self._content_hashes.add(content_hash)
+            batch.append({"document_name": name, "path": path, "content_hash": content_hash})
+            if len(batch) >= self.batch_size:
+                if not self._put(outbox, batch):
+                    return
+                batch = []
+        if batch:
+            self._put(outbox, batch)
+        self._put(outbox, _DONE)
+
+    def _map(self, fn: Callable[[List[dict]], List[dict]], inbox: queue.Queue, outbox: queue.Queue):
+        while (batch := self._get(inbox)) is not _DONE:
+            batch = fn(batch)
+            if batch and not self._put(outbox, batch):
+                return
+        self._put(outbox, _DONE)
+
+    def _extract_batch(self, batch: List[dict]) -> List[dict]:
+        paths = [item["path"] for item in batch]
+        try:
+            texts = self.processor.extract_texts(paths)
+        except Exception:
+            # Find the culprit; the others are still ingested.
+            texts = []
+            for path in paths:
+                try:
+                    texts.extend(self.processor.extract_texts([path]))
+                except Exception as e:
+                    print(f"skipping {path}: {e}")
+                    texts.append(False)
+
+        # Files unpacked from a zip are no longer needed once parsed.
+        for path in paths:
+            if path.startswith(self._workdir + os.sep):
+                os.remove(path)
+
+        kept = []
+        for item, text in zip(batch, texts):
+            if text is False:
+                self.stats["failed"] += 1
+                self._content_hashes.discard(item["content_hash"])
+                continue
+            content = self.processor.clean_text(text) if text else ""
+            text_hash = text_fingerprint(content)
+            if content and text_hash in self._text_hashes:
+                self.stats["duplicates"] += 1
+                continue
+            self._text_hashes.add(text_hash)
+            item.update(content=content, text_hash=text_hash, id=str(uuid.uuid4()))
+            kept.append(item)
+        return kept
+
+    def _embed_batch(self, batch: List[dict]) -> List[dict]:
+        chunked = [self.processor.chunk_text(item["content"]) for item in batch]
+        vectors = encode_texts([chunk for chunks in chunked for chunk in chunks])
+
+        offset = 0
+        for item, chunks in zip(batch, chunked):
+            chunk_vectors = vectors[offset:offset + len(chunks)]
+            offset += len(chunks)
+            item["chunks"] = [
+                {"document_id": item["id"], "chunk_index": i, "content": chunk, "vector_embeddings": vector.tobytes()}
+                for i, (chunk, vector) in enumerate(zip(chunks, chunk_vectors))
+            ]
+            item["vector_embeddings"] = pool_vectors(chunk_vectors).tobytes() if chunks else None
+        return batch
+
+    def _write(self, inbox: queue.Queue):
+        documents, chunks, jobs = [], [], []
+
+        def flush():
+            if not documents:
+                return
+            db = SessionLocal()
+            try:
+                db.execute(insert(Document), documents)
+                if chunks:
+                    db.execute(insert(DocumentChunk), chunks)
+                if jobs:
+                    db.execute(insert(ProcessingJob), jobs)
+                db.commit()
+            finally:
+                db.close()
+            self.stats["inserted"] += len(documents)
+            print(f"{self.stats['inserted']} documents written, {self.stats['skipped']} skipped")
+            documents.clear()
+            chunks.clear()
+            jobs.clear()
+
+        now = datetime.utcnow()
+        while (batch := self._get(inbox)) is not _DONE:
+            for item in batch:
+                documents.append({
+                    "id": item["id"],
+                    "document_name": item["document_name"],
+                    "content": item["content"],
+                    "vector_embeddings": item["vector_embeddings"],
+                    "content_hash": item["content_hash"],
+                    "text_hash": item["text_hash"],
+                    "embedding_model": self.embedding_model,
+                })
+                chunks.extend(item["chunks"])
+                if self.extract:
+                    jobs.append({"id": str(uuid.uuid4()), "document_id": item["id"], "available_at": now})
+            if len(documents) >= self.commit_every:
+                flush()
+        if self._error is None:
+            flush()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m app.ingest", description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="directory or .zip archive of .pdf/.txt files")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("INGEST_BATCH_SIZE", "32")),
+                        help="files parsed and embedded together")
+    parser.add_argument("--commit-every", type=int, default=int(os.getenv("INGEST_COMMIT_EVERY", "1000")),
+                        help="documents written per transaction")
+    parser.add_argument("--queue-size", type=int, default=4, help="batches buffered between stages")
+    parser.add_argument("--no-extract", action="store_true", help="do not queue LLM extraction jobs")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.source):
+        parser.error(f"{args.source} does not exist")
+
+    init_db()
+    stats = Pipeline(
+        args.source,
+        batch_size=args.batch_size,
+        commit_every=args.commit_every,
+        queue_size=args.queue_size,
+        extract=not args.no_extract,
+    ).run()
+    print(
+        f"done: {stats['inserted']} inserted, {stats['skipped']} already stored, "
+        f"{stats['duplicates']} duplicates, "
+        f"{stats['failed']} failed of {stats['seen']} files in {stats['seconds']}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
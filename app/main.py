@@ -1,16 +1,49 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
+import asyncio
+import logging
 import os
-from app.api.routes import router as api_router
-from app.database import init_db
+import time
+from app.api.routes import router as api_router, job_queue, processor, readiness, search_engine
+from app.database import db_writer, init_db
+from app.services.embeddings import warm_up
+from app.services.metrics import finish_profile, server_timing, start_profile
+from app.services.ollama_client import ollama_client
 
-try:
-    init_db()
-except Exception as e:
-    raise HTTPException(status_code=500, detail=str(e))
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
-app = FastAPI(title="AI Document Processing System")
+
+async def load_services():
+    # Runs after the app starts serving, so restarts are live in well under
+    # a second; /api/health/ready reports when this has finished.
+    try:
+        # Opt-in: load the embedding model now instead of on the first
+        # request that needs it.
+        if os.getenv("EMBEDDING_WARMUP", "false").lower() in ("1", "true", "yes"):
+            await run_in_threadpool(warm_up, search_engine.model_name)
+        readiness["embedding_model"] = True
+    except Exception:
+        logger.exception("Startup loading failed")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(init_db)
+    await job_queue.start()
+    loading = asyncio.create_task(load_services())
+    yield
+    # A step already running in a thread is finished first.
+    loading.cancel()
+    with suppress(asyncio.CancelledError):
+        await loading
+    await job_queue.stop()
+    processor.close()
+    db_writer.close()
+    await ollama_client.close()
+
+app = FastAPI(title="AI Document Processing System", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,6 +52,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    # Opt-in per request: send "X-Profile: 1" to get a Server-Timing header
+    # with the time spent in each stage while producing the response.
+    if request.headers.get("x-profile", "").lower() not in ("1", "true", "yes"):
+        return await call_next(request)
+
+    token = start_profile()
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        profile = finish_profile(token)
+    profile["total"] = [time.perf_counter() - started, 1]
+    response.headers["Server-Timing"] = server_timing(profile)
+    return response
+
 app.include_router(api_router, prefix="/api")
 
 @app.get("/")
@@ -26,4 +76,6 @@ async def root():
     return {"message": "AI Document Processing API is running"}
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
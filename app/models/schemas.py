@@ -16,6 +16,16 @@ class DocumentResponse(DocumentBase):
     
     model_config = ConfigDict(from_attributes=True)
 
+class SearchResult(BaseModel):
+    id: UUID
+    document_name: str
+    score: float
+    processed_output: Optional[Dict[str, Any]] = None
+
+class DocumentPage(BaseModel):
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
 class ChatQuery(BaseModel):
     query: str
 
@@ -25,5 +35,8 @@ class ChatResponse(BaseModel):
 class ProcessingStatus(BaseModel):
     job_id: str
     status: str
-    progress: int
-    current_file: str
+    progress: int = 0
+    current_file: Optional[str] = None
+    document_id: Optional[str] = None
+    attempts: int = 0
+    error: Optional[str] = None
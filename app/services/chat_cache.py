@@ -0,0 +1,117 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+from app.services.metrics import Counter
+
+CHAT_CACHE_LOOKUPS = Counter(
+    "docproc_chat_cache_lookups_total", "Chat answer cache lookups by result.", labels=("result",)
+)
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(re.sub(r"[^\w$.,-]+", " ", query.lower()).split()).strip(" .,")
+
+
+@dataclass
+class ChatCacheKey:
+    # corpus_version is the value read before answering; an answer stored
+    # under it is never served once documents change. signature is the query
+    # planner's filters, which near-duplicates must share exactly ("June
+    # bills" and "July bills" embed almost identically).
+    corpus_version: int
+    query: str
+    signature: str
+    vector: Optional[np.ndarray] = None
+
+
+@dataclass
+class _Entry:
+    answer: Any
+    vector: Optional[np.ndarray]
+    created_at: float = field(default_factory=time.monotonic)
+
+
+# In-process LRU of chat answers, keyed by (corpus version, filters,
+# normalized query).
+# Entries expire after ttl seconds. A miss on the exact query falls back to
+# the most similar cached query of the same version and filters, if the
+# cosine similarity of their embeddings is at least `similarity`.
+class ChatCache:
+    def __init__(self, max_entries: int = None, ttl: float = None, similarity: float = None):
+        self.max_entries = max_entries or int(os.getenv("CHAT_CACHE_SIZE", "256"))
+        self.ttl = ttl or float(os.getenv("CHAT_CACHE_TTL_SECONDS", "3600"))
+        self.similarity = similarity or float(os.getenv("CHAT_CACHE_SIMILARITY", "0.95"))
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[int, str, str], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: ChatCacheKey) -> Tuple[bool, Any]:
+        # Returns (found, answer). Call get_similar() next on a miss if the
+        # query vector is available.
+        with self._lock:
+            entry = self._live((key.corpus_version, key.signature, key.query))
+            if entry is not None:
+                self.hits += 1
+                CHAT_CACHE_LOOKUPS.inc(result="hit")
+                return True, entry.answer
+            return False, None
+
+    def get_similar(self, key: ChatCacheKey) -> Tuple[bool, Any]:
+        with self._lock:
+            best, best_score = None, self.similarity
+            if key.vector is not None:
+                for cache_key in list(self._entries):
+                    if cache_key[:2] != (key.corpus_version, key.signature):
+                        continue
+                    entry = self._live(cache_key, touch=False)
+                    if entry is None or entry.vector is None:
+                        continue
+                    score = float(np.dot(entry.vector, key.vector))
+                    if score >= best_score:
+                        best, best_score = cache_key, score
+
+            if best is None:
+                self.misses += 1
+                CHAT_CACHE_LOOKUPS.inc(result="miss")
+                return False, None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            CHAT_CACHE_LOOKUPS.inc(result="similar")
+            return True, self._entries[best].answer
+
+    def put(self, key: ChatCacheKey, answer: Any):
+        with self._lock:
+            # Answers for an older corpus can never be served again.
+            for cache_key in [k for k in self._entries if k[0] < key.corpus_version]:
+                del self._entries[cache_key]
+            cache_key = (key.corpus_version, key.signature, key.query)
+            self._entries[cache_key] = _Entry(answer, key.vector)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _live(self, cache_key: Tuple[int, str, str], touch: bool = True) -> Optional[_Entry]:
+        entry = self._entries.get(cache_key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.created_at > self.ttl:
+            del self._entries[cache_key]
+            return None
+        if touch:
+            self._entries.move_to_end(cache_key)
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
@@ -1,38 +1,125 @@
-import ollama
 import json
-from typing import List, Dict, Any
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from app.database import Document
+from app.database import Document, corpus_version, knn_search
+from app.services.chat_cache import ChatCache, ChatCacheKey, normalize_query
 from app.services.search_engine import SearchEngine
-from sentence_transformers import util
-import torch
-from dotenv import load_dotenv
+from app.services.query_planner import QueryPlanner
+from app.services.embeddings import encode_texts
 import os
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from app.services.metrics import timed
+from app.services.ollama_client import OllamaClient, ollama_client
 
-load_dotenv()
 
-print("Model_name", os.getenv("OLLAMA_MODEL"))
+CHAT_OPTIONS = {
+    "temperature": 0.1,  # Lower temperature for better JSON consistency
+}
+
+# Rough chars-per-token ratio used to keep the prompt inside the budget
+# without running the LLM tokenizer.
+CHARS_PER_TOKEN = 4
 
 
 class ChatbotService:
-    def __init__(self, model_name: str = None):
+    def __init__(
+        self,
+        model_name: str = None,
+        top_k: int = None,
+        context_tokens: int = None,
+        search_engine: SearchEngine = None,
+        client: OllamaClient = None,
+        cache: ChatCache = None,
+    ):
         self.model_name = model_name or os.getenv("OLLAMA_MODEL") or "qwen3-vl:latest"
-        self.search_engine = SearchEngine()
+        self.top_k = top_k or int(os.getenv("CHAT_TOP_K", "10"))
+        self.context_tokens = context_tokens or int(os.getenv("CHAT_CONTEXT_TOKENS", "3000"))
+        self.search_engine = search_engine or SearchEngine()
+        self.planner = QueryPlanner()
+        self.client = client or ollama_client
+        self.cache = cache or ChatCache()
+
+    @timed("chat_lookup")
+    def lookup(self, query: str, db: Session) -> Tuple[bool, Any, ChatCacheKey]:
+        # Returns (found, answer, key); pass the key to prepare() and store()
+        # on a miss. The query is only embedded if the exact text misses.
+        plan = self.planner.plan(query)
+        key = ChatCacheKey(
+            corpus_version=corpus_version(db),
+            query=normalize_query(query),
+            signature=plan.model_dump_json(exclude={"residual"}),
+        )
+        found, answer = self.cache.get(key)
+        if not found:
+            if self.search_engine.model:
+                key.vector = encode_texts([query], model_name=self.search_engine.model_name)[0]
+            found, answer = self.cache.get_similar(key)
+        return found, answer, key
+
+    def store(self, key: Optional[ChatCacheKey], answer: Any):
+        if key is not None:
+            self.cache.put(key, answer)
+
+    def retrieve(self, query: str, db: Session, query_embedding=None) -> List[Document]:
+        if not self.search_engine.model:
+            return []
 
-    def chat(self, query: str, db: Session) -> str:
-        # Fetch all documents to provide full context as requested
-        all_docs = db.query(Document).all()
+        if query_embedding is None:
+            query_embedding = encode_texts([query], model_name=self.search_engine.model_name)[0]
+        hits = knn_search(db, query_embedding.tolist(), self.top_k)
+        if not hits:
+            return []
 
-        context = ""
-        for doc in all_docs:
+        docs = {
+            doc.id: doc
+            for doc in db.query(Document).filter(Document.id.in_([doc_id for doc_id, _ in hits]))
+        }
+        return [docs[doc_id] for doc_id, _ in hits if doc_id in docs]
+
+    def build_context(self, docs: List[Document]) -> str:
+        budget = self.context_tokens * CHARS_PER_TOKEN
+        parts = []
+        for doc in docs:
             if doc.processed_output:
-                context += f"Document: {doc.document_name}\nData: {json.dumps(doc.processed_output)}\n\n"
+                part = f"Document: {doc.document_name}\nData: {json.dumps(doc.processed_output)}\n\n"
             elif doc.content:
-                context += f"Document: {doc.document_name}\nContent: {doc.content[:500]}...\n\n"
+                part = f"Document: {doc.document_name}\nContent: {doc.content[:500]}...\n\n"
+            else:
+                continue
+
+            # Docs arrive most relevant first, so stop at the first one that
+            # no longer fits rather than skipping ahead to smaller ones.
+            if len(part) > budget:
+                break
+            parts.append(part)
+            budget -= len(part)
+
+        return "".join(parts)
+
+    @timed("chat_prepare")
+    def prepare(self, query: str, db: Session, query_embedding=None) -> Tuple[Optional[Any], Optional[str]]:
+        # Returns (answer, None) when the question can be answered without the
+        # LLM, otherwise (None, prompt).
+        #
+        # Filter-style questions ("utility bills due in June") run as SQL over
+        # processed_output. If nothing but filters was asked, answer without
+        # calling the LLM. If the filters matched nothing but the question has
+        # more to it, they may have been misread, so retrieve as usual. The
+        # same goes for an empty month or year match: the SQL only understands
+        # ISO dates, and extractions may hold dates in other formats.
+        plan = self.planner.plan(query)
+        docs = []
+        if plan.has_filters:
+            docs = self.planner.run(plan, db)
+            if plan.is_simple and (docs or not (plan.month or plan.year)):
+                return {"response": [self.planner.format_row(doc) for doc in docs]}, None
+        if not docs:
+            docs = self.retrieve(query, db, query_embedding)
+
+        context = self.build_context(docs)
 
-        print("Content:", context)
         # prompt = f"""
         # You are a highly capable Document AI Assistant. Your goal is to provide precise, structured answers based on the provided document context.
 
@@ -90,32 +177,110 @@ class ChatbotService:
         "response": [ <filtered objects only> ]
         }}
         """
-        # print("Model_name":self.model_name)
+        return None, prompt
+
+    async def chat(self, query: str, db: Session) -> str:
+        found, answer, key = await run_in_threadpool(self.lookup, query, db)
+        if found:
+            return answer
+
+        answer, prompt = await run_in_threadpool(self.prepare, query, db, key.vector)
+        if prompt is None:
+            self.store(key, answer)
+            return answer
+
         try:
-            response = ollama.generate(
-                model=self.model_name,
-                prompt=prompt,
-                options={
-                    "temperature": 0.1,  # Lower temperature for better JSON consistency
-                },
-            )
-            content = response["response"].strip()
-
-            # Remove markdown code blocks if present
-            if content.startswith("```"):
-                content = content.split("```")[1]
-                if content.startswith("json"):
-                    content = content[4:]
-                content = content.strip("`").strip()
-
-            # Attempt to strip C-style comments if the LLM included them
-            import re
-
-            content = re.sub(r"//.*", "", content)
-
-            try:
-                return json.loads(content)
-            except json.JSONDecodeError:
-                return content
+            response = await self.client.generate(self.model_name, prompt, options=CHAT_OPTIONS)
+            cleaner = ResponseCleaner()
+            cleaner.feed(response["response"])
+            answer = cleaner.finish()
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
+        self.store(key, answer)
+        return answer
+
+    async def stream(
+        self, prompt: Optional[str], answer: Any = None, key: Optional[ChatCacheKey] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        # Takes the output of prepare(). Yields {"type": "token"} events as
+        # Ollama produces text, then one {"type": "result"} event with the
+        # parsed answer, which is cached under key if one is given.
+        if prompt is None:
+            self.store(key, answer)
+            yield {"type": "result", "response": answer}
+            return
+
+        cleaner = ResponseCleaner()
+        try:
+            async for part in self.client.generate_stream(self.model_name, prompt, options=CHAT_OPTIONS):
+                text = cleaner.feed(part["response"])
+                if text:
+                    yield {"type": "token", "content": text}
+        except Exception as e:
+            yield {"type": "error", "detail": str(e)}
+            return
+
+        answer = cleaner.finish()
+        self.store(key, answer)
+        yield {"type": "result", "response": answer}
+
+
+# Strips markdown code fences and // comments from LLM output as it streams.
+# Text is released as soon as it cannot be the start of a fence or comment;
+# finish() parses everything released so far.
+class ResponseCleaner:
+    def __init__(self):
+        self._output: List[str] = []
+        self._pending = ""
+        self._line_has_text = False
+        self._skip_line = False
+
+    def feed(self, chunk: str) -> str:
+        released = []
+        for char in chunk:
+            if char == "\n":
+                if not self._skip_line:
+                    released.append(self._pending + "\n")
+                self._pending = ""
+                self._line_has_text = False
+                self._skip_line = False
+                continue
+            if self._skip_line:
+                continue
+
+            self._pending += char
+            if not self._line_has_text:
+                stripped = self._pending.lstrip()
+                if stripped == "```":
+                    # Fence line, including any language tag after it.
+                    self._pending = ""
+                    self._skip_line = True
+                    continue
+                if "```".startswith(stripped):
+                    continue
+                self._line_has_text = True
+
+            if self._pending.endswith("//"):
+                released.append(self._pending[:-2])
+                self._pending = ""
+                self._skip_line = True
+            elif self._pending.endswith("/"):
+                released.append(self._pending[:-1])
+                self._pending = "/"
+            else:
+                released.append(self._pending)
+                self._pending = ""
+
+        text = "".join(released)
+        self._output.append(text)
+        return text
+
+    def finish(self) -> Any:
+        if not self._skip_line:
+            self._output.append(self._pending)
+        self._pending = ""
+        content = "".join(self._output).strip()
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError:
+            return content
@@ -0,0 +1,105 @@
+import csv
+import io
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import and_, select
+from sqlalchemy.orm import Session
+from app.database import Document, SessionLocal, output_field
+from app.services.llm_extractor import SCHEMAS
+
+# Columns a listing may ask for. content and vector_embeddings are the bulk
+# of each row, so they are only read when requested.
+LISTABLE_COLUMNS = {column.name: column for column in Document.__table__.columns}
+DEFAULT_COLUMNS = ["id", "document_name", "processed_output"]
+
+# CSV export columns: every field any extraction schema produces.
+EXPORT_FIELDS = ["class", "document_type"] + list(dict.fromkeys(
+    field.split(" ")[0] for fields in SCHEMAS.values() for field in fields
+))
+
+EXPORT_PAGE_SIZE = 1000
+
+
+def _conditions(doc_class: Optional[str], date_from: Optional[str], date_to: Optional[str]):
+    conditions = []
+    if doc_class:
+        conditions.append(output_field("class") == doc_class)
+    if date_from:
+        conditions.append(output_field("date") >= date_from)
+    if date_to:
+        conditions.append(output_field("date") <= date_to)
+    return conditions
+
+
+def list_documents(
+    db: Session,
+    columns: Optional[List[str]] = None,
+    limit: int = 50,
+    after: Optional[str] = None,
+    doc_class: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    # Keyset pagination on the primary key: each page starts after the last
+    # id of the previous one, so deep pages cost the same as the first.
+    # Returns the rows and the cursor for the next page, or None at the end.
+    columns = list(dict.fromkeys(["id"] + (columns or DEFAULT_COLUMNS)))
+    unknown = [name for name in columns if name not in LISTABLE_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+
+    conditions = _conditions(doc_class, date_from, date_to)
+    if after:
+        conditions.append(Document.id > after)
+
+    rows = db.execute(
+        select(*(LISTABLE_COLUMNS[name] for name in columns))
+        .where(and_(*conditions))
+        .order_by(Document.id)
+        .limit(limit + 1)
+    ).mappings().all()
+
+    next_cursor = rows[limit - 1]["id"] if len(rows) > limit else None
+    return [dict(row) for row in rows[:limit]], next_cursor
+
+
+def iter_outputs(
+    doc_class: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    # Walks the matching documents page by page with its own session, so it
+    # can feed a streaming response after the request's session is closed.
+    after = None
+    while True:
+        db = SessionLocal()
+        try:
+            rows, after = list_documents(
+                db, DEFAULT_COLUMNS, EXPORT_PAGE_SIZE, after, doc_class, date_from, date_to
+            )
+        finally:
+            db.close()
+        yield from rows
+        if after is None:
+            return
+
+
+def export_ndjson(rows: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row) + "\n"
+
+
+def export_csv(rows: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["id", "document_name"] + EXPORT_FIELDS)
+    for row in rows:
+        output = row["processed_output"] or {}
+        writer.writerow([row["id"], row["document_name"]] + [
+            json.dumps(value) if isinstance(value, (dict, list)) else value
+            for value in (output.get(field) for field in EXPORT_FIELDS)
+        ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
@@ -1,12 +1,129 @@
-import pdfplumber
 import os
-from typing import Optional
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Optional, Tuple
+from app.services.metrics import timed
+from app.services.pdf_backends import extract_pages, get_backend
+
+
+class ExtractionError(Exception):
+    # A file whose text could not be extracted. status_code is the HTTP
+    # status the API answers with (504 for a timeout).
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
 
 class DocumentProcessor:
-    def __init__(self):
-        pass
+    def __init__(
+        self,
+        chunk_window: int = None,
+        chunk_overlap: int = None,
+        workers: int = None,
+        pages_per_task: int = None,
+        timeout: float = None,
+        backend: str = None,
+        fallback: bool = None,
+    ):
+        # Windows are counted in words; 180 words stays under MiniLM's
+        # 256-token limit for typical English text.
+        self.chunk_window = chunk_window or int(os.getenv("CHUNK_WINDOW_WORDS", "180"))
+        self.chunk_overlap = chunk_overlap if chunk_overlap is not None else int(os.getenv("CHUNK_OVERLAP_WORDS", "30"))
+        if not 0 <= self.chunk_overlap < self.chunk_window:
+            raise ValueError("chunk_overlap must be between 0 and chunk_window")
+
+        # pdfplumber is pure Python, so threads serialise on the GIL. With
+        # PDF_WORKERS > 1 PDFs are parsed in a process pool instead, large
+        # ones split into page ranges of PDF_PAGES_PER_TASK. PDF_TIMEOUT_SECONDS
+        # is enforced by the pool, so it only applies with PDF_WORKERS > 1.
+        self.workers = workers if workers is not None else int(os.getenv("PDF_WORKERS", "0"))
+        self.pages_per_task = pages_per_task or int(os.getenv("PDF_PAGES_PER_TASK", "25"))
+        self.timeout = timeout or float(os.getenv("PDF_TIMEOUT_SECONDS", "300"))
+        self._pool = None
+
+        # PDF_BACKEND picks the text engine (see pdf_backends). With
+        # PDF_FALLBACK, pages a fast engine leaves empty are retried with
+        # pdfplumber.
+        self.backend = backend or os.getenv("PDF_BACKEND", "pdfplumber")
+        self.fallback = fallback if fallback is not None else os.getenv("PDF_FALLBACK", "true").lower() in ("1", "true", "yes")
+        self._backend = get_backend(self.backend)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def close(self):
+        # Not waited for: a worker can be stuck on a file that timed out.
+        if self._pool is not None:
+            self._discard_pool(self._pool)
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        # Future.cancel() cannot stop a task that is already running, so the
+        # worker processes are terminated; the next call builds a fresh pool.
+        # Other calls sharing the pool fail with an ExtractionError.
+        if self._pool is pool:
+            self._pool = None
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
 
     def extract_text(self, file_path: str) -> Optional[str]:
+        return self.extract_texts([file_path])[0]
+
+    @timed("parse")
+    def extract_texts(self, file_paths: List[str]) -> List[Optional[str]]:
+        if self.workers <= 1:
+            return [self._extract_one(path) for path in file_paths]
+
+        # Submit every page range of every PDF up front so separate files and
+        # the pages of one large file all spread across the pool. Each file's
+        # deadline counts from its submission, not from when its results are
+        # collected.
+        pool = self._get_pool()
+        submitted = []
+        for path in file_paths:
+            if not path.lower().endswith('.pdf'):
+                submitted.append((path, None, None))
+                continue
+            try:
+                page_count = self._backend.page_count(path)
+            except Exception as e:
+                raise ExtractionError(str(e)) from e
+            submitted.append((path, time.monotonic() + self.timeout, [
+                pool.submit(extract_pages, self.backend, self.fallback, path, start, stop)
+                for start, stop in self._page_ranges(page_count)
+            ]))
+
+        results = []
+        for path, deadline, futures in submitted:
+            if futures is None:
+                results.append(self._extract_one(path))
+                continue
+
+            pages = []
+            try:
+                for future in futures:
+                    pages.extend(future.result(timeout=max(deadline - time.monotonic(), 0)))
+            except FutureTimeoutError:
+                self._discard_pool(pool)
+                raise ExtractionError(f"Timed out extracting text from {os.path.basename(path)}", status_code=504)
+            except Exception as e:
+                raise ExtractionError(str(e)) from e
+            results.append(self._join_pages(pages))
+
+        return results
+
+    def _page_ranges(self, page_count: int) -> List[Tuple[int, int]]:
+        return [
+            (start, min(start + self.pages_per_task, page_count))
+            for start in range(0, page_count, self.pages_per_task)
+        ]
+
+    def _extract_one(self, file_path: str) -> Optional[str]:
         if file_path.lower().endswith('.pdf'):
             return self._extract_from_pdf(file_path)
         elif file_path.lower().endswith('.txt'):
@@ -14,26 +131,36 @@ class DocumentProcessor:
         return None
 
     def _extract_from_pdf(self, file_path: str) -> Optional[str]:
-        text = ""
         try:
-            with pdfplumber.open(file_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-            return text.strip() if text else None
+            page_count = self._backend.page_count(file_path)
+            return self._join_pages(extract_pages(self.backend, self.fallback, file_path, 0, page_count))
         except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+            raise ExtractionError(str(e)) from e
+
+    @staticmethod
+    def _join_pages(pages) -> Optional[str]:
+        text = "\n".join(page for page in pages if page).strip()
+        return text or None
 
     def _extract_from_txt(self, file_path: str) -> Optional[str]:
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 return f.read().strip()
         except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+            raise ExtractionError(str(e)) from e
 
     def clean_text(self, text: str) -> str:
         if not text:
             return ""
         lines = [line.strip() for line in text.splitlines() if line.strip()]
         return "\n".join(lines)
+
+    def chunk_text(self, text: str) -> List[str]:
+        words = text.split() if text else []
+        if not words:
+            return []
+        step = self.chunk_window - self.chunk_overlap
+        return [
+            " ".join(words[start:start + self.chunk_window])
+            for start in range(0, max(len(words) - self.chunk_overlap, 1), step)
+        ]
@@ -0,0 +1,63 @@
+import os
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+from app.services.metrics import timed
+
+DEFAULT_EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+
+# One SentenceTransformer per model name for the whole process. Loading is
+# deferred to first use so importing the API does not pay for it.
+_models: Dict[str, object] = {}
+_lock = threading.Lock()
+
+
+def resolve_model_name(model_name: Optional[str] = None) -> str:
+    return model_name or DEFAULT_EMBEDDING_MODEL
+
+
+def get_embedding_model(model_name: Optional[str] = None):
+    name = resolve_model_name(model_name)
+    model = _models.get(name)
+    if model is None:
+        with _lock:
+            model = _models.get(name)
+            if model is None:
+                from sentence_transformers import SentenceTransformer
+
+                model = SentenceTransformer(name)
+                _models[name] = model
+    return model
+
+
+def is_model_loaded(model_name: Optional[str] = None) -> bool:
+    return resolve_model_name(model_name) in _models
+
+
+@timed("embed")
+def encode_texts(
+    texts: List[str], batch_size: Optional[int] = None, model_name: Optional[str] = None
+) -> np.ndarray:
+    # SentenceTransformer.encode sorts the inputs by length before batching
+    # (and restores the order afterwards), so batches pad to similar lengths.
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    vectors = get_embedding_model(model_name).encode(
+        texts,
+        batch_size=batch_size or EMBEDDING_BATCH_SIZE,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    )
+    return vectors.astype(np.float32, copy=False)
+
+
+def pool_vectors(vectors: np.ndarray) -> np.ndarray:
+    # Normalized mean of chunk vectors, used as the whole-document embedding.
+    pooled = vectors.mean(axis=0)
+    norm = np.linalg.norm(pooled)
+    return (pooled / norm if norm else pooled).astype(np.float32)
+
+
+def warm_up(model_name: Optional[str] = None):
+    get_embedding_model(model_name).encode("warm up")
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+from app.database import ProcessingJob, SessionLocal, db_writer
+from app.services.metrics import Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+JOB_BATCH_SECONDS = Histogram("docproc_job_batch_seconds", "Time to run one claimed batch of jobs.")
+
+
+def _job_counts() -> Dict[tuple, int]:
+    db = SessionLocal()
+    try:
+        return {
+            (status,): count
+            for status, count in db.query(ProcessingJob.status, func.count()).group_by(ProcessingJob.status)
+        }
+    finally:
+        db.close()
+
+
+Gauge("docproc_jobs", "Processing jobs by status; queued is the queue depth.", fn=_job_counts, labels=("status",))
+
+
+# Jobs live in the processing_jobs table, so they survive restarts and are
+# visible to every worker process. Each process runs a fixed number of
+# asyncio workers that claim up to batch_size queued jobs at a time and pass
+# their document ids to the handler, retrying failures with exponential
+# backoff. The handler may return {document_id: exception} for documents
+# that failed; raising fails the whole batch.
+HandlerResult = Optional[Dict[str, Exception]]
+
+
+class JobQueue:
+    def __init__(
+        self,
+        handler: Callable[[List[str]], Union[HandlerResult, Awaitable[HandlerResult]]],
+        workers: int = None,
+        batch_size: int = 1,
+        max_attempts: int = None,
+        backoff_seconds: float = None,
+        poll_interval: float = 1.0,
+        stale_after: float = None,
+    ):
+        self.handler = handler
+        self.batch_size = max(batch_size, 1)
+        self.workers = workers or int(os.getenv("JOB_WORKERS", "2"))
+        self.max_attempts = max_attempts or int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+        self.backoff_seconds = backoff_seconds if backoff_seconds is not None else float(os.getenv("JOB_BACKOFF_SECONDS", "5"))
+        self.poll_interval = poll_interval
+        # Running jobs are touched every heartbeat_interval while their batch
+        # is in flight, so one left untouched for stale_after belonged to a
+        # process that died. Idle workers requeue such jobs as often.
+        self.stale_after = stale_after or float(os.getenv("JOB_STALE_SECONDS", "120"))
+        self.heartbeat_interval = self.stale_after / 4
+        self._last_requeue = 0.0
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def enqueue(self, db: Session, document_id: str) -> ProcessingJob:
+        # A document already waiting or in flight keeps its existing job.
+        job = (
+            db.query(ProcessingJob)
+            .filter(
+                ProcessingJob.document_id == document_id,
+                ProcessingJob.status.in_(["queued", "running"]),
+            )
+            .first()
+        )
+        if job is None:
+            job = ProcessingJob(document_id=document_id)
+            db.add(job)
+        return job
+
+    def notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            if time.monotonic() - self._last_requeue >= self.heartbeat_interval:
+                self._last_requeue = time.monotonic()
+                await db_writer.run_async(self._requeue_stale)
+
+            job_ids = await db_writer.run_async(self._claim)
+            if not job_ids:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run(job_ids)
+
+    async def _run(self, job_ids: List[str]):
+        db = SessionLocal()
+        try:
+            # Keyed by job: two claimed jobs may share a document.
+            jobs = {job.id: (job.document_id, job.attempts) for job in db.query(ProcessingJob).filter(ProcessingJob.id.in_(job_ids))}
+        finally:
+            db.close()
+        document_ids = list(dict.fromkeys(document_id for document_id, _ in jobs.values()))
+
+        heartbeat = asyncio.create_task(self._heartbeat(list(jobs)))
+        started = time.perf_counter()
+        try:
+            # Async handlers run on the loop; plain functions in the
+            # threadpool.
+            if asyncio.iscoroutinefunction(self.handler):
+                failures = await self.handler(document_ids)
+            else:
+                failures = await run_in_threadpool(self.handler, document_ids)
+            failures = failures or {}
+        except Exception as e:
+            failures = {document_id: e for document_id in document_ids}
+        finally:
+            heartbeat.cancel()
+        JOB_BATCH_SECONDS.observe(time.perf_counter() - started)
+
+        await db_writer.run_async(lambda db: self._finish(db, jobs, failures))
+
+    async def _heartbeat(self, job_ids: List[str]):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            await db_writer.run_async(
+                lambda db: db.execute(
+                    update(ProcessingJob)
+                    .where(ProcessingJob.id.in_(job_ids), ProcessingJob.status == "running")
+                    .values(updated_at=datetime.utcnow())
+                )
+            )
+
+    def _finish(self, db: Session, jobs: Dict[str, tuple], failures: Dict[str, Exception]):
+        for job_id, (document_id, attempts) in jobs.items():
+            job = db.get(ProcessingJob, job_id)
+            error = failures.get(document_id)
+            if error is None:
+                job.status = "complete"
+                job.error = None
+                continue
+
+            logger.warning("Job %s failed (attempt %s/%s): %s", job_id, attempts, self.max_attempts, error)
+            job.error = str(error)
+            if attempts < self.max_attempts:
+                job.status = "queued"
+                job.available_at = datetime.utcnow() + timedelta(
+                    seconds=self.backoff_seconds * 2 ** (attempts - 1)
+                )
+            else:
+                job.status = "error"
+
+    def _claim(self, db: Session) -> List[str]:
+        # Runs on the database writer thread, which commits afterwards.
+        claimed_ids = []
+        while len(claimed_ids) < self.batch_size:
+            candidates = (
+                db.query(ProcessingJob.id)
+                .filter(ProcessingJob.status == "queued", ProcessingJob.available_at <= datetime.utcnow())
+                .order_by(ProcessingJob.available_at)
+                .limit(self.batch_size - len(claimed_ids))
+                .all()
+            )
+            if not candidates:
+                break
+
+            for (candidate,) in candidates:
+                # Conditional update so two workers (or processes) never
+                # claim the same job.
+                claimed = db.execute(
+                    update(ProcessingJob)
+                    .where(ProcessingJob.id == candidate, ProcessingJob.status == "queued")
+                    .values(
+                        status="running",
+                        attempts=ProcessingJob.attempts + 1,
+                        updated_at=datetime.utcnow(),
+                    )
+                ).rowcount
+                if claimed:
+                    claimed_ids.append(candidate)
+        return claimed_ids
+
+    def _requeue_stale(self, db: Session):
+        db.execute(
+            update(ProcessingJob)
+            .where(
+                ProcessingJob.status == "running",
+                ProcessingJob.updated_at < datetime.utcnow() - timedelta(seconds=self.stale_after),
+            )
+            .values(status="queued", available_at=datetime.utcnow())
+        )
@@ -0,0 +1,74 @@
+import hashlib
+import os
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import func
+from app.database import LLMCacheEntry, SessionLocal, db_writer
+from app.services.metrics import Counter, timed
+
+LLM_CACHE_LOOKUPS = Counter(
+    "docproc_llm_cache_lookups_total", "Extraction cache lookups by result.", labels=("result",)
+)
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+# Raw LLM responses keyed by (model, prompt hash). Once the stored responses
+# exceed max_bytes, the least recently used entries are evicted.
+class LLMCache:
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = max_bytes or int(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+    @timed("llm_cache_lookup")
+    def get(self, model: str, prompt: str) -> Optional[str]:
+        key = prompt_hash(prompt)
+        db = SessionLocal()
+        try:
+            entry = db.get(LLMCacheEntry, (model, key))
+            if entry is None:
+                LLM_CACHE_LOOKUPS.inc(result="miss")
+                return None
+            response = entry.response
+        finally:
+            db.close()
+
+        LLM_CACHE_LOOKUPS.inc(result="hit")
+        # Recency only drives eviction, so the hit does not wait for it.
+        db_writer.submit(
+            lambda db: db.query(LLMCacheEntry)
+            .filter_by(model=model, prompt_hash=key)
+            .update({"last_used_at": datetime.utcnow()})
+        )
+        return response
+
+    def put(self, model: str, prompt: str, response: str):
+        def write(db):
+            db.merge(LLMCacheEntry(
+                model=model,
+                prompt_hash=prompt_hash(prompt),
+                response=response,
+                size=len(response.encode("utf-8")),
+                last_used_at=datetime.utcnow(),
+            ))
+            db.flush()
+            self._evict(db)
+
+        db_writer.run(write)
+
+    def _evict(self, db):
+        total = db.query(func.coalesce(func.sum(LLMCacheEntry.size), 0)).scalar()
+        if total <= self.max_bytes:
+            return
+
+        entries = (
+            db.query(LLMCacheEntry.model, LLMCacheEntry.prompt_hash, LLMCacheEntry.size)
+            .order_by(LLMCacheEntry.last_used_at)
+            .all()
+        )
+        for model, key, size in entries:
+            if total <= self.max_bytes:
+                break
+            db.query(LLMCacheEntry).filter_by(model=model, prompt_hash=key).delete()
+            total -= size
@@ -1,83 +1,248 @@
-import ollama
+import asyncio
 import json
 import logging
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Set, Tuple, Union
 import os
-from dotenv import load_dotenv
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from app.services.llm_cache import LLMCache, prompt_hash
+from app.services.ollama_client import OllamaClient, ollama_client
 
-load_dotenv()
-
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# Fields extracted for each document type.
+SCHEMAS = {
+    "Invoice": [
+        "invoice_number (string)",
+        "date (string, YYYY-MM-DD format if possible)",
+        "company (string, vendor name)",
+        "total_amount (string or number)",
+    ],
+    "Resume": [
+        "name (string)",
+        "email (string)",
+        "phone (string)",
+        "experience_years (number, estimate if needed)",
+    ],
+    "Utility Bill": [
+        "account_number (string)",
+        "date (string, YYYY-MM-DD format if possible)",
+        "usage_kwh (string or number)",
+        "amount_due (string or number)",
+    ],
+    "Other": [
+        "summary (string, brief summary of content)",
+    ],
+}
+
+DOCUMENT_TYPES = tuple(SCHEMAS)
+
+
+def _schema_lines(doc_class: str) -> str:
+    return "".join(f"           - {field}\n" for field in SCHEMAS[doc_class])
+
+
+# Shared by the single- and multi-document prompts.
+CLASSIFICATION_RULES = (
+    "        STRICT CLASSIFICATION RULES:\n"
+    "        Classify the document into exactly ONE of these types:\n"
+    '        - "Invoice"\n'
+    '        - "Resume"\n'
+    '        - "Utility Bill"\n'
+    "        - \"Other\" (if it doesn't clearly fit the above)\n"
+    "\n"
+    "        REQUIRED EXTRACTION SCHEMAS:\n"
+    "        \n"
+    + "           \n".join(
+        f'        {i}. IF "{doc_class}":\n{_schema_lines(doc_class)}'
+        for i, doc_class in enumerate(SCHEMAS, start=1)
+    )
+)
+
+
 class LLMExtractor:
-    def __init__(self, model_name: str = None):
+    def __init__(
+        self,
+        model_name: str = None,
+        cache: LLMCache = None,
+        client: OllamaClient = None,
+        timeout: float = 60,
+        batch_size: int = None,
+        batch_max_chars: int = None,
+    ):
         self.model_name = model_name or os.getenv("OLLAMA_MODEL") or "qwen3-vl:latest"
-        self.timeout = 60
+        self.timeout = timeout
+        self.cache = cache or LLMCache()
+        self.client = client or ollama_client
+        # EXTRACT_BATCH_SIZE > 1 enables multi-document prompts for texts of
+        # at most EXTRACT_BATCH_MAX_CHARS.
+        self.batch_size = batch_size or int(os.getenv("EXTRACT_BATCH_SIZE", "1"))
+        self.batch_max_chars = batch_max_chars or int(os.getenv("EXTRACT_BATCH_MAX_CHARS", "1500"))
+        # Changes whenever any prompt template (single, batch or typed) or
+        # schema does, so stored extractions and cached replies made with an
+        # older prompt can be told apart.
+        self.prompt_version = prompt_hash("\n".join([
+            self._build_prompt("", "Unknown"),
+            self._build_batch_prompt([("", "")]),
+            *(self._build_typed_prompt("", doc_class) for doc_class in SCHEMAS),
+            json.dumps(SCHEMAS, sort_keys=True),
+        ]))[:16]
 
-    def extract(self, text: str, doc_class: str) -> Dict[str, Any]:
+    async def extract(self, text: str, doc_class: str) -> Dict[str, Any]:
+        # doc_class is "Unknown" unless the pre-classifier already settled the
+        # type, in which case the prompt asks for that one schema only.
         prompt = self._build_prompt(text, doc_class)
 
         try:
-            response = ollama.generate(
-                model=self.model_name,
-                prompt=prompt,
+            result = self._normalize(await self._generate_json(prompt, num_predict=512))
+            if doc_class in SCHEMAS:
+                result["document_type"] = doc_class
+            return result
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    async def extract_many(self, items: List[Tuple[str, str]]) -> Dict[str, Union[Dict[str, Any], Exception]]:
+        # items are (document_id, text). Short texts are packed batch_size to a
+        # prompt so the long instructions are paid once per batch; anything
+        # the batch answer leaves out or garbles is retried on its own.
+        # Returns each document's extraction, or the exception it failed with.
+        batches, singles = [], []
+        for item in items:
+            if self.batch_size > 1 and len(item[1]) <= self.batch_max_chars:
+                if not batches or len(batches[-1]) >= self.batch_size:
+                    batches.append([])
+                batches[-1].append(item)
+            else:
+                singles.append(item)
+
+        results: Dict[str, Union[Dict[str, Any], Exception]] = {}
+
+        async def run_single(doc_id: str, text: str):
+            try:
+                results[doc_id] = await self.extract(text, "Unknown")
+            except Exception as e:
+                results[doc_id] = e
+
+        async def run_batch(batch: List[Tuple[str, str]]):
+            if len(batch) == 1:
+                await run_single(*batch[0])
+                return
+            # A batch asks for len(batch) answers at once, so it gets that many
+            # times the single-document token and time budget. Batch prompts
+            # embed document ids and never repeat, so they are not cached.
+            try:
+                raw_data = await self._generate_json(
+                    self._build_batch_prompt(batch),
+                    num_predict=512 * len(batch),
+                    timeout=self.timeout * len(batch),
+                    cache=False,
+                )
+                parsed = self._parse_batch(raw_data, {doc_id for doc_id, _ in batch})
+            except Exception as e:
+                logger.warning("Batch extraction of %s documents failed, retrying individually: %s", len(batch), e)
+                parsed = {}
+            results.update(parsed)
+            await asyncio.gather(*(run_single(doc_id, text) for doc_id, text in batch if doc_id not in parsed))
+
+        await asyncio.gather(
+            *(run_batch(batch) for batch in batches),
+            *(run_single(doc_id, text) for doc_id, text in singles),
+        )
+        return results
+
+    async def _generate_json(self, prompt: str, num_predict: int, timeout: float = None, cache: bool = True) -> Any:
+        cached = await run_in_threadpool(self.cache.get, self.model_name, prompt) if cache else None
+        if cached is None:
+            response = await self.client.generate(
+                self.model_name,
+                prompt,
+                timeout=timeout or self.timeout,
                 format="json",
                 options={
                     "temperature": 0,
-                    "num_predict": 512,
+                    "num_predict": num_predict,
                 },
             )
+            content = response["response"]
+        else:
+            content = cached
 
-            raw_data = json.loads(response["response"])
+        raw_data = json.loads(content)
+        if cache and cached is None:
+            await run_in_threadpool(self.cache.put, self.model_name, prompt, content)
+        return raw_data
 
-            if "extracted_data" in raw_data and isinstance(
-                raw_data["extracted_data"], dict
+    @staticmethod
+    def _normalize(raw_data: Dict[str, Any]) -> Dict[str, Any]:
+        if "extracted_data" in raw_data and isinstance(
+            raw_data["extracted_data"], dict
+        ):
+            extracted_data = raw_data["extracted_data"]
+            extracted_data["document_type"] = raw_data.get("document_type", "Other")
+            return extracted_data
+
+        return raw_data
+
+    def _parse_batch(self, raw_data: Any, doc_ids: Set[str]) -> Dict[str, Dict[str, Any]]:
+        entries = raw_data.get("documents") if isinstance(raw_data, dict) else raw_data
+        if not isinstance(entries, list):
+            raise ValueError("batch response has no documents array")
+
+        parsed = {}
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            doc_id = str(entry.get("document_id", ""))
+            if (
+                doc_id in doc_ids
+                and doc_id not in parsed
+                and entry.get("document_type") in DOCUMENT_TYPES
+                and isinstance(entry.get("extracted_data"), dict)
             ):
-                extracted_data = raw_data["extracted_data"]
-                extracted_data["document_type"] = raw_data.get("document_type", "Other")
-                return extracted_data
+                parsed[doc_id] = self._normalize(entry)
+        return parsed
 
-            return raw_data
+    def _build_batch_prompt(self, batch: List[Tuple[str, str]]) -> str:
+        documents = "\n".join(
+            f"""
+        Document ID: {doc_id}
+        ---
+        {text}
+        ---"""
+            for doc_id, text in batch
+        )
+        return f"""
+        Analyze each of the {len(batch)} documents below separately and extract structured data.
 
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+{CLASSIFICATION_RULES}
+        OUTPUT FORMAT:
+        Return ONLY a raw JSON object. Do not include markdown formatting (```json).
+        Return one entry per document, in any order, using its exact Document ID:
+        {{
+            "documents": [
+                {{
+                    "document_id": "The Document ID",
+                    "document_type": "The Class Name",
+                    "extracted_data": {{ ... fields based on schema ... }}
+                }}
+            ]
+        }}
+
+        Documents to process:
+        {documents}
+
+        Return ONLY the valid JSON object.
+        """
 
     def _build_prompt(self, text: str, doc_class: str) -> str:
+        if doc_class in SCHEMAS:
+            return self._build_typed_prompt(text, doc_class)
+
         prompt = f"""
         Analyze the text below and extract structured data.
         
-        STRICT CLASSIFICATION RULES:
-        Classify the document into exactly ONE of these types:
-        - "Invoice"
-        - "Resume"
-        - "Utility Bill"
-        - "Other" (if it doesn't clearly fit the above)
-
-        REQUIRED EXTRACTION SCHEMAS:
-        
-        1. IF "Invoice":
-           - invoice_number (string)
-           - date (string, YYYY-MM-DD format if possible)
-           - company (string, vendor name)
-           - total_amount (string or number)
-           
-        2. IF "Resume":
-           - name (string)
-           - email (string)
-           - phone (string)
-           - experience_years (number, estimate if needed)
-           
-        3. IF "Utility Bill":
-           - account_number (string)
-           - date (string)
-           - usage_kwh (string or number)
-           - amount_due (string or number)
-           
-        4. IF "Other":
-           - summary (string, brief summary of content)
-
+{CLASSIFICATION_RULES}
         OUTPUT FORMAT:
         Return ONLY a raw JSON object. Do not include markdown formatting (```json).
         The JSON must have this exact structure:
@@ -95,5 +260,26 @@ class LLMExtractor:
         """
         return prompt
 
+    def _build_typed_prompt(self, text: str, doc_class: str) -> str:
+        fields = "\n".join(
+            f"        - {name} ({description})"
+            for name, description in self._get_schema_for_class(doc_class).items()
+        )
+        return f"""
+        The text below has been classified as "{doc_class}". Extract these fields:
+{fields}
+
+        Return ONLY a raw JSON object with exactly these keys. Use null for missing values.
+
+        Text to process:
+        ---
+        {text[:2500]}
+        ---
+        """
+
     def _get_schema_for_class(self, doc_class: str) -> Dict[str, str]:
-        return {}
+        schema = {}
+        for field in SCHEMAS.get(doc_class, []):
+            name, _, description = field.partition(" (")
+            schema[name] = description.rstrip(")")
+        return schema
@@ -0,0 +1,173 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Seconds; spans a cache hit up to a slow LLM call or large PDF.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+LabelValues = Tuple[str, ...]
+
+
+# Minimal metrics registry rendered in the Prometheus text format, so
+# /api/metrics needs no client library.
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def _format_labels(self, values: LabelValues, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> Iterator[str]:
+        return iter(())
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{self._format_labels(key)} {value}"
+
+
+# Value read when metrics are scraped, from a callback returning either a
+# number or {label values: number}.
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], object], labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def samples(self) -> Iterator[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            return
+        values = value if isinstance(value, dict) else {(): value}
+        for key, sample in values.items():
+            if sample is not None:
+                yield f"{self.name}{self._format_labels(key)} {sample}"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+        # label values -> (bucket counts, sum, count)
+        self._values: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        for key, counts, total, count in values:
+            for bound, bucket_count in zip(self.buckets, counts):
+                le = self._format_labels(key, f'le="{bound}"')
+                yield f"{self.name}_bucket{le} {bucket_count}"
+            le = self._format_labels(key, 'le="+Inf"')
+            yield f"{self.name}_bucket{le} {count}"
+            yield f"{self.name}_sum{self._format_labels(key)} {total}"
+            yield f"{self.name}_count{self._format_labels(key)} {count}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY: List[Metric] = []
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+STAGE_SECONDS = Histogram(
+    "docproc_stage_seconds", "Time spent in each processing stage.", labels=("stage",)
+)
+
+# Stage totals for the current request when profiling was asked for; None
+# otherwise. Threadpool calls inherit the context, so stages timed there are
+# recorded too.
+_profile: contextvars.ContextVar[Optional[Dict[str, List[float]]]] = contextvars.ContextVar("profile", default=None)
+_profile_lock = threading.Lock()
+
+
+def start_profile() -> contextvars.Token:
+    return _profile.set({})
+
+
+def finish_profile(token: contextvars.Token) -> Dict[str, List[float]]:
+    # Returns {stage: [seconds, calls]}.
+    profile = _profile.get() or {}
+    _profile.reset(token)
+    return profile
+
+
+def server_timing(profile: Dict[str, List[float]]) -> str:
+    # Server-Timing header value, which browser dev tools display as-is.
+    return ", ".join(
+        f'{stage};dur={seconds * 1000:.1f};desc="{calls}x"'
+        for stage, (seconds, calls) in sorted(profile.items(), key=lambda item: -item[1][0])
+    )
+
+
+def record_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    profile = _profile.get()
+    if profile is not None:
+        with _profile_lock:
+            totals = profile.setdefault(stage, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += 1
+
+
+@contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
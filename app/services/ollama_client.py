@@ -0,0 +1,151 @@
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+from app.services.metrics import Counter, Gauge, Histogram, record_stage
+
+OLLAMA_REQUESTS = Counter(
+    "docproc_ollama_requests_total", "Ollama generate calls by outcome.", labels=("model", "status")
+)
+OLLAMA_TOKENS = Counter(
+    "docproc_ollama_tokens_total", "Tokens reported by Ollama (prompt_eval_count, eval_count).", labels=("model", "kind")
+)
+OLLAMA_DURATION = Histogram(
+    "docproc_ollama_duration_seconds",
+    "Durations reported by Ollama (load_duration, prompt_eval_duration, eval_duration).",
+    labels=("model", "phase"),
+)
+
+
+def _field(response: Any, name: str) -> Any:
+    try:
+        return response[name]
+    except (KeyError, TypeError):
+        return None
+
+
+def record_usage(model: str, response: Any):
+    # Ollama reports token counts and nanosecond durations on the final
+    # (or only) response.
+    for kind, name in (("prompt", "prompt_eval_count"), ("completion", "eval_count")):
+        count = _field(response, name)
+        if count:
+            OLLAMA_TOKENS.inc(count, model=model, kind=kind)
+    for phase in ("load", "prompt_eval", "eval"):
+        duration = _field(response, f"{phase}_duration")
+        if duration:
+            OLLAMA_DURATION.observe(duration / 1e9, model=model, phase=phase)
+
+
+# Shared async access to Ollama. One httpx connection pool serves every
+# caller in the process, and a semaphore per model caps how many requests
+# are in flight against it, so a large upload queues here instead of
+# piling up inside Ollama or tying up threadpool workers.
+class OllamaClient:
+    def __init__(
+        self,
+        host: str = None,
+        timeout: float = None,
+        max_concurrency: int = None,
+        keep_alive: str = None,
+    ):
+        self.host = host or os.getenv("OLLAMA_HOST")
+        self.timeout = timeout or float(os.getenv("OLLAMA_TIMEOUT", "60"))
+        self.max_concurrency = max_concurrency or int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2"))
+        # How long Ollama keeps the model loaded after a call.
+        self.keep_alive = keep_alive or os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+        self._client = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        # Requests waiting for or holding a model's semaphore.
+        self.pending: Dict[str, int] = {}
+
+    def _get_client(self):
+        if self._client is None:
+            import httpx
+            from ollama import AsyncClient
+
+            # No httpx read timeout: generate bounds each whole call with its
+            # own (possibly longer) timeout, generate_stream each chunk.
+            self._client = AsyncClient(
+                host=self.host,
+                timeout=httpx.Timeout(self.timeout, read=None),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency * 4,
+                    max_keepalive_connections=self.max_concurrency * 4,
+                ),
+            )
+        return self._client
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self._semaphores:
+            self._semaphores[model] = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphores[model]
+
+    async def generate(self, model: str, prompt: str, timeout: Optional[float] = None, **kwargs) -> Dict[str, Any]:
+        self.pending[model] = self.pending.get(model, 0) + 1
+        try:
+            queued = time.perf_counter()
+            async with self._semaphore(model):
+                record_stage("ollama_wait", time.perf_counter() - queued)
+                started = time.perf_counter()
+                try:
+                    response = await asyncio.wait_for(
+                        self._get_client().generate(
+                            model=model, prompt=prompt, keep_alive=self.keep_alive, **kwargs
+                        ),
+                        timeout=timeout or self.timeout,
+                    )
+                except Exception:
+                    OLLAMA_REQUESTS.inc(model=model, status="error")
+                    raise
+                finally:
+                    record_stage("ollama_generate", time.perf_counter() - started)
+        finally:
+            self.pending[model] -= 1
+
+        OLLAMA_REQUESTS.inc(model=model, status="ok")
+        record_usage(model, response)
+        return response
+
+    async def generate_stream(self, model: str, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        # The timeout applies between streamed chunks, not to the whole
+        # answer.
+        self.pending[model] = self.pending.get(model, 0) + 1
+        try:
+            async with self._semaphore(model):
+                started = time.perf_counter()
+                status = "error"
+                try:
+                    stream = await self._get_client().generate(
+                        model=model, prompt=prompt, stream=True, keep_alive=self.keep_alive, **kwargs
+                    )
+                    parts = stream.__aiter__()
+                    while True:
+                        try:
+                            part = await asyncio.wait_for(parts.__anext__(), timeout=self.timeout)
+                        except StopAsyncIteration:
+                            break
+                        if _field(part, "done"):
+                            record_usage(model, part)
+                        yield part
+                    status = "ok"
+                finally:
+                    OLLAMA_REQUESTS.inc(model=model, status=status)
+                    record_stage("ollama_generate", time.perf_counter() - started)
+        finally:
+            self.pending[model] -= 1
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+ollama_client = OllamaClient()
+
+Gauge(
+    "docproc_ollama_pending",
+    "Ollama requests queued or in flight, per model.",
+    fn=lambda: {(model,): count for model, count in ollama_client.pending.items()},
+    labels=("model",),
+)
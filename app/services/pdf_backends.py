@@ -0,0 +1,109 @@
+from typing import Dict, List, Type
+
+# Text extraction engines for DocumentProcessor. pdfplumber computes full
+# character layout and is the most faithful; pypdfium2 and pypdf only pull
+# the text stream and are several times faster on plain-text PDFs. Engine
+# imports happen on first use so only the selected one has to be installed.
+
+
+class PDFBackend:
+    name = ""
+
+    def page_count(self, file_path: str) -> int:
+        raise NotImplementedError
+
+    def extract_pages(self, file_path: str, start: int, stop: int) -> List[str]:
+        # Text of pages [start, stop), 0-based, "" for pages without text.
+        raise NotImplementedError
+
+
+class PdfplumberBackend(PDFBackend):
+    name = "pdfplumber"
+
+    def page_count(self, file_path: str) -> int:
+        import pdfplumber
+
+        with pdfplumber.open(file_path) as pdf:
+            return len(pdf.pages)
+
+    def extract_pages(self, file_path: str, start: int, stop: int) -> List[str]:
+        import pdfplumber
+
+        # pdfplumber numbers pages from 1.
+        with pdfplumber.open(file_path, pages=list(range(start + 1, stop + 1))) as pdf:
+            return [page.extract_text() or "" for page in pdf.pages]
+
+
+class PdfiumBackend(PDFBackend):
+    name = "pypdfium2"
+
+    def page_count(self, file_path: str) -> int:
+        import pypdfium2 as pdfium
+
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+    def extract_pages(self, file_path: str, start: int, stop: int) -> List[str]:
+        import pypdfium2 as pdfium
+
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            pages = []
+            for index in range(start, stop):
+                page = pdf[index]
+                textpage = page.get_textpage()
+                try:
+                    pages.append(textpage.get_text_bounded().replace("\r\n", "\n").strip())
+                finally:
+                    textpage.close()
+                    page.close()
+            return pages
+        finally:
+            pdf.close()
+
+
+class PypdfBackend(PDFBackend):
+    name = "pypdf"
+
+    @staticmethod
+    def _reader(file_path: str):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            from PyPDF2 import PdfReader
+        return PdfReader(file_path)
+
+    def page_count(self, file_path: str) -> int:
+        return len(self._reader(file_path).pages)
+
+    def extract_pages(self, file_path: str, start: int, stop: int) -> List[str]:
+        reader = self._reader(file_path)
+        return [(reader.pages[index].extract_text() or "").strip() for index in range(start, stop)]
+
+
+BACKENDS: Dict[str, Type[PDFBackend]] = {
+    backend.name: backend for backend in (PdfplumberBackend, PdfiumBackend, PypdfBackend)
+}
+
+
+def get_backend(name: str) -> PDFBackend:
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown PDF backend {name!r}, expected one of {sorted(BACKENDS)}")
+
+
+def extract_pages(backend_name: str, fallback: bool, file_path: str, start: int, stop: int) -> List[str]:
+    # Module-level so it can run in DocumentProcessor's worker processes.
+    # With fallback, pages the fast engine returns empty (odd encodings,
+    # tagged forms) are retried with pdfplumber.
+    pages = get_backend(backend_name).extract_pages(file_path, start, stop)
+    if fallback and backend_name != PdfplumberBackend.name:
+        plumber = PdfplumberBackend()
+        for offset, text in enumerate(pages):
+            if not text.strip():
+                pages[offset] = plumber.extract_pages(file_path, start + offset, start + offset + 1)[0]
+    return pages
@@ -0,0 +1,113 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import LargeBinary, or_, type_coerce
+from app.database import Document, SessionLocal, output_field
+from app.services.embeddings import resolve_model_name
+from app.services.llm_extractor import DOCUMENT_TYPES
+from app.services.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+
+# Nearest-centroid classifier over the stored document embeddings, trained on
+# the classes the LLM has already assigned. It only answers when the closest
+# centroid is both similar enough and clearly ahead of the runner-up; anything
+# else goes through the full classification prompt.
+class PreClassifier:
+    def __init__(
+        self,
+        labels: Tuple[str, ...] = DOCUMENT_TYPES,
+        min_samples: int = None,
+        min_similarity: float = None,
+        min_margin: float = None,
+        refresh_seconds: float = None,
+        enabled: bool = None,
+    ):
+        self.labels = labels
+        self.min_samples = min_samples or int(os.getenv("PRE_CLASSIFIER_MIN_SAMPLES", "20"))
+        self.min_similarity = min_similarity or float(os.getenv("PRE_CLASSIFIER_MIN_SIMILARITY", "0.5"))
+        self.min_margin = min_margin or float(os.getenv("PRE_CLASSIFIER_MIN_MARGIN", "0.1"))
+        self.refresh_seconds = refresh_seconds or float(os.getenv("PRE_CLASSIFIER_REFRESH_SECONDS", "300"))
+        if enabled is None:
+            enabled = os.getenv("PRE_CLASSIFIER", "true").lower() not in ("0", "false", "no")
+        self.enabled = enabled
+
+        self._classes: List[str] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._trained_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False):
+        if not self.enabled:
+            return
+        with self._lock:
+            if not force and time.monotonic() - self._trained_at < self.refresh_seconds:
+                return
+            self._train()
+            self._trained_at = time.monotonic()
+
+    @timed("pre_classifier_train")
+    def _train(self):
+        label = output_field("class")
+        classified_by = output_field("classified_by")
+        sums: Dict[str, np.ndarray] = {}
+        counts: Dict[str, int] = {}
+
+        db = SessionLocal()
+        try:
+            # Only labels the LLM chose itself, and only vectors from the
+            # current embedding model, so the centroids stay comparable.
+            rows = (
+                db.query(type_coerce(Document.vector_embeddings, LargeBinary), label)
+                .filter(
+                    Document.vector_embeddings.isnot(None),
+                    Document.embedding_model == resolve_model_name(),
+                    label.in_(self.labels),
+                    or_(classified_by.is_(None), classified_by != "local"),
+                )
+                .yield_per(1000)
+            )
+            for blob, doc_class in rows:
+                vector = np.frombuffer(blob, dtype=np.float32)
+                norm = np.linalg.norm(vector)
+                if not norm:
+                    continue
+                if doc_class in sums:
+                    sums[doc_class] += vector / norm
+                else:
+                    sums[doc_class] = vector / norm
+                counts[doc_class] = counts.get(doc_class, 0) + 1
+        finally:
+            db.close()
+
+        classes = [c for c in self.labels if counts.get(c, 0) >= self.min_samples]
+        if len(classes) < 2:
+            self._classes, self._centroids = [], None
+            return
+
+        centroids = np.stack([sums[c] / counts[c] for c in classes]).astype(np.float32)
+        centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+        self._classes, self._centroids = classes, centroids
+        logger.info("Pre-classifier trained on %s", {c: counts[c] for c in classes})
+
+    def predict(self, vector) -> Optional[str]:
+        # Returns the class when confident, otherwise None.
+        centroids, classes = self._centroids, self._classes
+        if not self.enabled or centroids is None or vector is None:
+            return None
+
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not norm or vector.shape[0] != centroids.shape[1]:
+            return None
+
+        scores = centroids @ (vector / norm)
+        order = np.argsort(scores)[::-1]
+        best, runner_up = scores[order[0]], scores[order[1]]
+        if best < self.min_similarity or best - runner_up < self.min_margin:
+            return None
+        return classes[order[0]]
@@ -0,0 +1,196 @@
+import re
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel
+from sqlalchemy import Float, and_, cast, func, or_
+from sqlalchemy.orm import Session, load_only
+from app.database import Document, output_field
+
+# Phrases mapped onto the classes LLMExtractor assigns in document_type.
+DOCUMENT_TYPES = [
+    (r"\butility\s+bills?\b|\bbills?\b", "Utility Bill"),
+    (r"\binvoices?\b", "Invoice"),
+    (r"\bresumes?\b|\bcvs?\b", "Resume"),
+]
+
+# Amount field each class carries (see LLMExtractor._build_prompt).
+AMOUNT_FIELDS = {
+    "Invoice": ["total_amount"],
+    "Utility Bill": ["amount_due"],
+}
+
+MONTHS = {
+    name: i
+    for i, names in enumerate(
+        [
+            ("january", "jan"), ("february", "feb"), ("march", "mar"), ("april", "apr"),
+            ("may",), ("june", "jun"), ("july", "jul"), ("august", "aug"),
+            ("september", "sep", "sept"), ("october", "oct"), ("november", "nov"),
+            ("december", "dec"),
+        ],
+        start=1,
+    )
+    for name in names
+}
+
+NUMBER = r"\$?\s*(\d[\d,]*(?:\.\d+)?)"
+AMOUNT_BETWEEN = re.compile(rf"\bbetween\s+{NUMBER}\s+and\s+{NUMBER}")
+AMOUNT_MIN = re.compile(rf"(\bover|\babove|\bmore than|\bgreater than|\bexceeding|\bat least|>=?)\s*{NUMBER}")
+AMOUNT_MAX = re.compile(rf"(\bunder|\bbelow|\bless than|\bat most|<=?)\s*{NUMBER}")
+# Bounds that include the amount itself; the other phrases are strict.
+INCLUSIVE_BOUNDS = {"at least", ">=", "at most", "<="}
+MONTH = re.compile(r"\b(" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\b")
+# "may" is only a month next to a date word or a day/year number; otherwise
+# it is the verb ("which invoices may be overdue").
+MAY_BEFORE = re.compile(r"\b(?:in|of|on|during|since|until|till|before|after|due|dated|issued|from|by)\s+$")
+MAY_AFTER = re.compile(r"^\s+(?:\d{1,2}(?:st|nd|rd|th)?|19\d{2}|20\d{2})\b")
+YEAR = re.compile(r"\b(19\d{2}|20\d{2})\b")
+COMPANY = re.compile(
+    r"\b(?:from|by|vendor|company)\s+(.+?)"
+    r"(?=\s+(?:in|on|over|above|under|below|due|with|between|for|dated|issued)\b|[?.,!]|$)"
+)
+
+# Words that carry no predicate. A query made only of these plus recognised
+# filters is answered straight from SQL.
+FILLER_WORDS = {
+    "show", "list", "get", "find", "give", "fetch", "return", "display", "me", "all",
+    "my", "the", "a", "an", "of", "in", "on", "for", "with", "due", "dated", "issued",
+    "which", "what", "are", "is", "were", "was", "any", "that", "documents", "document",
+    "please", "and", "from", "by", "amount", "amounts", "than", "to",
+}
+
+
+class QueryPlan(BaseModel):
+    document_type: Optional[str] = None
+    month: Optional[int] = None
+    year: Optional[int] = None
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+    min_inclusive: bool = False
+    max_inclusive: bool = False
+    company: Optional[str] = None
+    residual: List[str] = []
+
+    @property
+    def has_filters(self) -> bool:
+        return any(
+            value is not None
+            for value in (self.document_type, self.month, self.year,
+                          self.min_amount, self.max_amount, self.company)
+        )
+
+    @property
+    def is_simple(self) -> bool:
+        return self.has_filters and not self.residual
+
+
+class QueryPlanner:
+    def __init__(self, max_rows: int = 500):
+        self.max_rows = max_rows
+
+    def plan(self, query: str) -> QueryPlan:
+        text = query.lower()
+        plan = QueryPlan()
+
+        def consume(match: re.Match) -> None:
+            nonlocal text
+            text = text[:match.start()] + " " + text[match.end():]
+
+        match = AMOUNT_BETWEEN.search(text)
+        if match:
+            plan.min_amount = _to_number(match.group(1))
+            plan.max_amount = _to_number(match.group(2))
+            plan.min_inclusive = plan.max_inclusive = True
+            consume(match)
+        else:
+            match = AMOUNT_MIN.search(text)
+            if match:
+                plan.min_amount = _to_number(match.group(2))
+                plan.min_inclusive = match.group(1) in INCLUSIVE_BOUNDS
+                consume(match)
+            match = AMOUNT_MAX.search(text)
+            if match:
+                plan.max_amount = _to_number(match.group(2))
+                plan.max_inclusive = match.group(1) in INCLUSIVE_BOUNDS
+                consume(match)
+
+        for pattern, document_type in DOCUMENT_TYPES:
+            match = re.search(pattern, text)
+            if match:
+                plan.document_type = document_type
+                consume(match)
+                break
+
+        match = _month_match(text)
+        if match:
+            plan.month = MONTHS[match.group(1)]
+            consume(match)
+
+        match = YEAR.search(text)
+        if match:
+            plan.year = int(match.group(1))
+            consume(match)
+
+        match = COMPANY.search(text)
+        if match and match.group(1).strip():
+            plan.company = match.group(1).strip()
+            consume(match)
+
+        plan.residual = [
+            word for word in re.findall(r"[a-z0-9]+", text) if word not in FILLER_WORDS
+        ]
+        return plan
+
+    def run(self, plan: QueryPlan, db: Session) -> List[Document]:
+        conditions = []
+        if plan.document_type:
+            conditions.append(output_field("document_type") == plan.document_type)
+        if plan.month:
+            conditions.append(func.strftime("%m", output_field("date")) == f"{plan.month:02d}")
+        if plan.year:
+            conditions.append(func.strftime("%Y", output_field("date")) == str(plan.year))
+        if plan.company:
+            conditions.append(func.lower(output_field("company")).contains(plan.company))
+        if plan.min_amount is not None or plan.max_amount is not None:
+            conditions.append(self._amount_condition(plan))
+
+        return (
+            db.query(Document)
+            .options(load_only(Document.id, Document.document_name, Document.processed_output))
+            .filter(and_(*conditions))
+            .order_by(output_field("date"))
+            .limit(self.max_rows)
+            .all()
+        )
+
+    def _amount_condition(self, plan: QueryPlan):
+        fields = AMOUNT_FIELDS.get(plan.document_type, ["total_amount", "amount_due"])
+        options = []
+        for name in fields:
+            # Amounts come back from the LLM as numbers or strings like "$1,200.00".
+            amount = cast(
+                func.replace(func.replace(output_field(name), "$", ""), ",", ""), Float
+            )
+            bounds = [output_field(name).isnot(None)]
+            if plan.min_amount is not None:
+                bounds.append(amount >= plan.min_amount if plan.min_inclusive else amount > plan.min_amount)
+            if plan.max_amount is not None:
+                bounds.append(amount <= plan.max_amount if plan.max_inclusive else amount < plan.max_amount)
+            options.append(and_(*bounds))
+        return or_(*options)
+
+    @staticmethod
+    def format_row(doc: Document) -> Dict[str, Any]:
+        return {"document_name": doc.document_name, **(doc.processed_output or {})}
+
+
+def _month_match(text: str) -> Optional[re.Match]:
+    for match in MONTH.finditer(text):
+        if match.group(1) != "may":
+            return match
+        if MAY_BEFORE.search(text[:match.start()]) or MAY_AFTER.match(text[match.end():]):
+            return match
+    return None
+
+
+def _to_number(value: str) -> float:
+    return float(value.replace(",", ""))
@@ -1,43 +1,112 @@
-from sentence_transformers import SentenceTransformer, util
-import torch
-import numpy as np
+import os
 from typing import List, Dict, Any
+from sqlalchemy.orm import Session, load_only
+from app.database import Document, SessionLocal, fts_search, knn_search
+from app.services.embeddings import encode_texts, get_embedding_model
+from app.services.metrics import timed
+
+# Reciprocal rank fusion constant: a document's fused score is the sum of
+# 1 / (RRF_K + rank) over the result lists it appears in.
+RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# Candidates taken from each of the keyword and vector lists per result.
+HYBRID_FANOUT = int(os.getenv("HYBRID_FANOUT", "4"))
 
 class SearchEngine:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = None):
+        self.model_name = model_name
+
+    @property
+    def model(self):
+        return get_embedding_model(self.model_name)
+
+    @timed("search_vector")
+    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        # Standalone vector search with its own session, returning snippets.
+        # Goes through the sqlite-vec index like search_index, so it sees
+        # every stored document, whichever process wrote it.
+        query_embedding = encode_texts([query], model_name=self.model_name)[0].tolist()
+        db = SessionLocal()
         try:
-            self.model = SentenceTransformer(model_name)
-        except Exception as e:
-            self.model = None
-            raise HTTPException(status_code=500, detail=str(e))
-        self.documents = []
-        self.embeddings = None
+            hits = knn_search(db, query_embedding, top_k)
+            docs = {
+                doc.id: doc
+                for doc in db.query(Document)
+                .options(load_only(Document.id, Document.document_name, Document.content, Document.processed_output))
+                .filter(Document.id.in_([doc_id for doc_id, _ in hits]))
+            }
+        finally:
+            db.close()
 
-    def index_documents(self, docs: List[Dict[str, Any]]):
-        if not self.model or not docs:
-            return
+        results = []
+        for doc_id, distance in hits:
+            doc = docs.get(doc_id)
+            if doc is None:
+                continue
+            results.append({
+                "id": doc.id,
+                "score": 1.0 - float(distance),
+                "filename": doc.document_name,
+                "metadata": doc.processed_output or {},
+                "snippet": (doc.content or "")[:300] + "..."
+            })
 
-        self.documents = docs
-        texts = [doc['text'] for doc in docs]
-        self.embeddings = self.model.encode(texts, convert_to_tensor=True)
+        return results
 
-    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
-        if not self.model or self.embeddings is None:
+    @timed("search_vector")
+    def search_index(self, query: str, db: Session, top_k: int = 5) -> List[Dict[str, Any]]:
+        if not self.model:
             return []
 
-        query_embedding = self.model.encode(query, convert_to_tensor=True)
-        cos_scores = util.cos_sim(query_embedding, self.embeddings)[0]
+        query_embedding = encode_texts([query], model_name=self.model_name)[0].tolist()
+        hits = [(doc_id, 1.0 - float(distance)) for doc_id, distance in knn_search(db, query_embedding, top_k)]
+        return self._load_results(db, hits)
+
+    @timed("search_keyword")
+    def keyword_search(self, query: str, db: Session, top_k: int = 5) -> List[Dict[str, Any]]:
+        # BM25 over the full-text index only; no model is involved. Scores are
+        # negated bm25 so that higher is better, as elsewhere.
+        hits = [(doc_id, -float(rank)) for doc_id, rank in fts_search(db, query, top_k)]
+        return self._load_results(db, hits)
+
+    @timed("search_hybrid")
+    def hybrid_search(self, query: str, db: Session, top_k: int = 5) -> List[Dict[str, Any]]:
+        # Fuses the keyword and vector rankings with reciprocal rank fusion,
+        # which needs no calibration between bm25 and cosine scores.
+        fetch_k = top_k * HYBRID_FANOUT
+        rankings = [fts_search(db, query, fetch_k)]
+        if self.model:
+            query_embedding = encode_texts([query], model_name=self.model_name)[0].tolist()
+            rankings.append(knn_search(db, query_embedding, fetch_k))
+
+        fused: Dict[str, float] = {}
+        for ranking in rankings:
+            for rank, (doc_id, _) in enumerate(ranking, start=1):
+                fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (RRF_K + rank)
+
+        hits = sorted(fused.items(), key=lambda hit: hit[1], reverse=True)[:top_k]
+        return self._load_results(db, hits)
+
+    def _load_results(self, db: Session, hits) -> List[Dict[str, Any]]:
+        if not hits:
+            return []
+
+        docs = {
+            doc.id: doc
+            for doc in db.query(Document)
+            .options(load_only(Document.id, Document.document_name, Document.processed_output))
+            .filter(Document.id.in_([doc_id for doc_id, _ in hits]))
+        }
 
-        top_results = torch.topk(cos_scores, k=min(top_k, len(self.documents)))
-        
         results = []
-        for score, idx in zip(top_results[0], top_results[1]):
-            doc_idx = idx.item()
+        for doc_id, score in hits:
+            doc = docs.get(doc_id)
+            if doc is None:
+                continue
             results.append({
-                "score": float(score),
-                "filename": self.documents[doc_idx]['filename'],
-                "metadata": self.documents[doc_idx].get('metadata', {}),
-                "snippet": self.documents[doc_idx]['text'][:300] + "..."
+                "id": doc.id,
+                "document_name": doc.document_name,
+                "score": score,
+                "processed_output": doc.processed_output,
             })
-        
+
         return results
@@ -1,7 +1,11 @@
 import os
 import shutil
+import hashlib
+import aiofiles
 from typing import List
 
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
 def ensure_dir(path: str):
     if not os.path.exists(path):
         os.makedirs(path)
@@ -25,3 +29,19 @@ def get_all_files(directory: str, extensions: List[str] = [".pdf", ".txt"]) -> L
             if any(filename.lower().endswith(ext) for ext in extensions):
                 files.append(os.path.join(root, filename))
     return files
+
+def text_fingerprint(text: str) -> str:
+    # Only whitespace is normalised: case can be significant (account and
+    # invoice ids), so documents differing in it are kept apart.
+    normalized = " ".join(text.split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+async def save_upload(upload, path: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    # Copies the upload to disk a chunk at a time and returns the sha256 of
+    # its bytes, so memory use stays at one chunk regardless of file size.
+    digest = hashlib.sha256()
+    async with aiofiles.open(path, "wb") as out:
+        while chunk := await upload.read(chunk_size):
+            digest.update(chunk)
+            await out.write(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,151 @@
+"""Measure concurrent write throughput against SQLite under three setups.
+
+    python -m benchmarks.db_concurrency [--writers 16] [--writes 200] [--readers 4]
+
+- default:  a plain engine (rollback journal, synchronous=FULL) with every
+            thread committing on its own, as the app did before;
+- pragmas:  the app's engine settings (WAL, synchronous=NORMAL, busy_timeout,
+            mmap and cache sizes), threads still committing on their own;
+- writer:   the app's engine settings with all writes going through a
+            DatabaseWriter.
+
+Each write is a small transaction shaped like a job state change, and reader
+threads list jobs alongside. Every setup starts from a fresh database file.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict
+
+from sqlalchemy import create_engine, func, update
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, DatabaseWriter, Document, ProcessingJob, make_engine
+
+SETUPS = ["default", "pragmas", "writer"]
+
+
+def write_job(db):
+    job = ProcessingJob(document_id=str(uuid.uuid4()))
+    db.add(job)
+    db.flush()
+    db.execute(
+        update(ProcessingJob)
+        .where(ProcessingJob.id == job.id)
+        .values(status="complete", attempts=1, updated_at=datetime.utcnow())
+    )
+
+
+def cell(value) -> str:
+    # Table cell; "-" for metrics a setup whose writes all failed lacks.
+    return "-" if value is None else str(value)
+
+
+def run_setup(setup: str, writers: int, writes: int, readers: int) -> Dict[str, object]:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        if setup == "default":
+            engine = create_engine(url, connect_args={"check_same_thread": False})
+        else:
+            engine = make_engine(url)
+        Base.metadata.create_all(engine, tables=[Document.__table__, ProcessingJob.__table__])
+        Session = sessionmaker(bind=engine, autoflush=False)
+        writer = DatabaseWriter(Session) if setup == "writer" else None
+
+        errors, reads = [0], [0]
+        latencies = []
+        done = threading.Event()
+        lock = threading.Lock()
+
+        def write_loop():
+            for _ in range(writes):
+                started = time.perf_counter()
+                try:
+                    if writer is not None:
+                        writer.run(write_job)
+                    else:
+                        db = Session()
+                        try:
+                            write_job(db)
+                            db.commit()
+                        finally:
+                            db.close()
+                except Exception:
+                    with lock:
+                        errors[0] += 1
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - started)
+
+        def read_loop():
+            while not done.is_set():
+                db = Session()
+                try:
+                    db.query(func.count(ProcessingJob.id)).filter(ProcessingJob.status == "complete").scalar()
+                    with lock:
+                        reads[0] += 1
+                except Exception:
+                    pass
+                finally:
+                    db.close()
+
+        reader_threads = [threading.Thread(target=read_loop) for _ in range(readers)]
+        writer_threads = [threading.Thread(target=write_loop) for _ in range(writers)]
+        for thread in reader_threads:
+            thread.start()
+        start = time.perf_counter()
+        for thread in writer_threads:
+            thread.start()
+        for thread in writer_threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        done.set()
+        for thread in reader_threads:
+            thread.join()
+        if writer is not None:
+            writer.close()
+        engine.dispose()
+
+    latencies.sort()
+    return {
+        "setup": setup,
+        "writes": len(latencies),
+        "errors": errors[0],
+        "seconds": round(elapsed, 3),
+        "writes_per_sec": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2) if latencies else None,
+        "reads_per_sec": round(reads[0] / elapsed, 1) if elapsed else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=16, help="concurrent writing threads")
+    parser.add_argument("--writes", type=int, default=200, help="transactions per writing thread")
+    parser.add_argument("--readers", type=int, default=4, help="concurrent reading threads")
+    parser.add_argument("--setups", nargs="+", default=SETUPS, choices=SETUPS)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = [run_setup(setup, args.writers, args.writes, args.readers) for setup in args.setups]
+
+    print(f"{'setup':<8} {'writes':>7} {'errors':>7} {'seconds':>8} {'writes/s':>9} {'p95 ms':>8} {'reads/s':>9}")
+    for r in results:
+        print(
+            f"{r['setup']:<8} {r['writes']:>7} {r['errors']:>7} {r['seconds']:>8} "
+            f"{cell(r['writes_per_sec']):>9} {cell(r['p95_ms']):>8} {cell(r['reads_per_sec']):>9}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,387 @@
+"""Run the whole pipeline over a synthetic corpus and report throughput.
+
+    python -m benchmarks.end_to_end [--sizes 1000 10000 100000] [--latency 0.2] [--output results.json]
+
+For each corpus size a mix of invoices, utility bills and resumes is written
+as PDF and TXT files, then driven through:
+
+- parse:    DocumentProcessor.extract_texts, --batch-size files per call;
+- embed:    chunking and batched encode_texts, as uploads do;
+- upload:   POST /api/documents/upload, --batch-size files per request,
+            which loads the corpus into the database;
+- search:   SearchEngine.search, one query per call;
+- extract:  process_documents on the first --extract-docs documents;
+- chat:     ChatbotService.chat, one query per call.
+
+Extraction and chat talk to a stub Ollama server (benchmarks.ollama_stub)
+started with --latency and --token-delay, so no model server or GPU is
+needed. Each size runs in a fresh process with its own database and upload
+directory, so peak RSS is per size; it is the process high-water mark after
+each stage. Latencies are per call.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from typing import Dict, List, Tuple
+
+from benchmarks.ollama_stub import start_stub
+
+SIZES = [1000, 10000, 100000]
+
+COMPANIES = ["Acme Corp", "Globex", "Initech", "Umbrella Supplies", "Stark Industries", "Wayne Enterprises"]
+UTILITIES = ["City Power", "Metro Electric", "Green Grid", "Northern Utilities"]
+NAMES = ["Alice Johnson", "Bilal Ahmed", "Chen Wei", "Diana Lopez", "Emeka Obi", "Farah Khan", "George Miller"]
+ROLES = ["Software Engineer", "Data Analyst", "Accountant", "Project Manager", "Designer"]
+ITEMS = ["Consulting services", "Office chairs", "Cloud hosting", "Printer toner", "Support plan", "Laptops"]
+
+QUERIES = [
+    "invoices from {company}",
+    "total amount on invoice INV-{number:06d}",
+    "electricity bills over {amount} kWh",
+    "how much is due on account {account}",
+    "resumes of {role}s with {years} years of experience",
+    "who has worked as a {role}",
+]
+
+
+def _date(rng: random.Random) -> str:
+    return f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+
+
+def invoice(rng: random.Random, i: int) -> List[str]:
+    lines = [
+        "INVOICE",
+        f"Invoice No: INV-{i:06d}",
+        f"Date: {_date(rng)}",
+        f"From: {rng.choice(COMPANIES)}",
+        f"Bill To: {rng.choice(NAMES)}",
+        "",
+    ]
+    total = 0.0
+    for item in rng.sample(ITEMS, 3):
+        quantity, price = rng.randint(1, 20), rng.uniform(5, 500)
+        total += quantity * price
+        lines.append(f"{item}  x{quantity}  {price:,.2f}  {quantity * price:,.2f}")
+    lines += ["", f"Total: {total:,.2f}", "Payment due within 30 days."]
+    return lines
+
+
+def utility_bill(rng: random.Random, i: int) -> List[str]:
+    usage = rng.randint(80, 2000)
+    return [
+        f"{rng.choice(UTILITIES)} Utility Services",
+        "ELECTRICITY STATEMENT",
+        f"Account Number: {rng.randint(100, 999)}-{i:07d}",
+        f"Statement Date: {_date(rng)}",
+        f"Service address: {rng.randint(1, 999)} Main Street",
+        f"Electricity usage this period: {usage} kWh",
+        f"Amount due: {usage * rng.uniform(0.1, 0.3):,.2f}",
+    ]
+
+
+def resume(rng: random.Random, i: int) -> List[str]:
+    name, role = rng.choice(NAMES), rng.choice(ROLES)
+    years = rng.randint(1, 25)
+    return [
+        "RESUME",
+        name,
+        f"Email: {name.split()[0].lower()}.{i}@example.com",
+        f"Phone: +1 555 {rng.randint(100, 999)} {rng.randint(1000, 9999)}",
+        "",
+        "EXPERIENCE",
+        f"{role} at {rng.choice(COMPANIES)}, {years} years",
+        f"Led a team of {rng.randint(2, 12)} and delivered {rng.randint(3, 40)} projects.",
+        "",
+        "EDUCATION",
+        f"B.Sc. in {rng.choice(['Computer Science', 'Finance', 'Economics', 'Design'])}",
+    ]
+
+
+GENERATORS = [invoice, utility_bill, resume]
+
+
+def make_pdf(lines: List[str]) -> bytes:
+    # A single-page PDF with one line of Helvetica per text line; enough for
+    # every PDF backend to extract without pulling in a PDF writer.
+    text = "".join(
+        "(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") Tj T*\n"
+        for line in lines
+    )
+    stream = f"BT /F1 10 Tf 14 TL 50 780 Td\n{text}ET".encode("latin-1", "replace")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+    ]
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+
+def generate_corpus(directory: str, size: int, pdf_share: float, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(size):
+        generator = GENERATORS[i % len(GENERATORS)]
+        lines = generator(rng, i)
+        if rng.random() < pdf_share:
+            path = os.path.join(directory, f"{generator.__name__}_{i:06d}.pdf")
+            with open(path, "wb") as f:
+                f.write(make_pdf(lines))
+        else:
+            path = os.path.join(directory, f"{generator.__name__}_{i:06d}.txt")
+            with open(path, "w") as f:
+                f.write("\n".join(lines) + "\n")
+        paths.append(path)
+    return paths
+
+
+def make_queries(count: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    return [
+        rng.choice(QUERIES).format(
+            company=rng.choice(COMPANIES),
+            number=rng.randint(0, 99999),
+            amount=rng.randint(1, 20) * 100,
+            account=f"{rng.randint(100, 999)}-{rng.randint(0, 99999):07d}",
+            role=rng.choice(ROLES).lower(),
+            years=rng.randint(1, 20),
+        )
+        for _ in range(count)
+    ]
+
+
+def batches(items: List, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentile(values: List[float], q: float) -> float:
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def summarize(stage: str, items: int, seconds: float, latencies: List[float], batch: int) -> Dict[str, object]:
+    latencies = sorted(latencies)
+    return {
+        "stage": stage,
+        "items": items,
+        "batch": batch,
+        "seconds": round(seconds, 3),
+        "per_sec": round(items / seconds, 2) if seconds else None,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def timed_calls(calls) -> Tuple[float, List[float]]:
+    # calls yields once per call, after the call has run.
+    latencies = []
+    start = last = time.perf_counter()
+    for _ in calls:
+        now = time.perf_counter()
+        latencies.append(now - last)
+        last = now
+    return time.perf_counter() - start, latencies
+
+
+def run_size(size: int, options: Dict[str, object]) -> Dict[str, object]:
+    # Runs in a fresh process. The environment is set before the app is
+    # imported, since its modules read their settings at import time.
+    workdir = tempfile.mkdtemp(prefix=f"e2e-{size}-")
+    os.chdir(workdir)
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        OLLAMA_HOST=options["ollama_host"],
+    )
+    try:
+        paths = generate_corpus(os.path.join(workdir, "corpus"), size, options["pdf_share"], options["seed"])
+        batch_size = options["batch_size"]
+
+        from fastapi.testclient import TestClient
+        from app.main import app
+        from app.api.routes import chatbot, process_documents, processor, search_engine
+        from app.database import Document, SessionLocal, init_db
+        from app.services.embeddings import encode_texts, resolve_model_name
+        from app.services.ollama_client import ollama_client
+
+        stages = []
+
+        texts = []
+
+        def parse():
+            for batch in batches(paths, batch_size):
+                texts.extend(processor.extract_texts(batch))
+                yield
+
+        seconds, latencies = timed_calls(parse())
+        stages.append(summarize("parse", len(paths), seconds, latencies, batch_size))
+
+        def embed():
+            for batch in batches(texts, batch_size):
+                chunks = [processor.chunk_text(processor.clean_text(text)) for text in batch]
+                encode_texts([chunk for doc_chunks in chunks for chunk in doc_chunks])
+                yield
+
+        seconds, latencies = timed_calls(embed())
+        stages.append(summarize("embed", len(texts), seconds, latencies, batch_size))
+        del texts[:]
+
+        # The app's lifespan is not run, so the job queue stays idle and the
+        # extract stage below is the only LLM traffic during uploads.
+        init_db()
+        client = TestClient(app)
+
+        def upload():
+            for batch in batches(paths, batch_size):
+                files = [
+                    ("files", (os.path.basename(path), open(path, "rb"),
+                               "application/pdf" if path.endswith(".pdf") else "text/plain"))
+                    for path in batch
+                ]
+                try:
+                    client.post("/api/documents/upload", files=files).raise_for_status()
+                finally:
+                    for _, (_, f, _) in files:
+                        f.close()
+                yield
+
+        seconds, latencies = timed_calls(upload())
+        stages.append(summarize("upload", len(paths), seconds, latencies, batch_size))
+
+        db = SessionLocal()
+        try:
+            doc_ids = [doc_id for (doc_id,) in db.query(Document.id).order_by(Document.id).limit(options["extract_docs"])]
+        finally:
+            db.close()
+        search_queries = make_queries(options["queries"], options["seed"])
+        chat_queries = make_queries(options["chat_queries"], options["seed"] + 1)
+
+        seconds, latencies = timed_calls(search_engine.search(query, top_k=5) for query in search_queries)
+        stages.append(summarize("search", len(search_queries), seconds, latencies, 1))
+
+        async def llm_stages():
+            # One event loop for both, since the Ollama client is bound to it.
+            latencies, failed = [], 0
+            start = time.perf_counter()
+            for batch in batches(doc_ids, options["extract_batch"]):
+                started = time.perf_counter()
+                failed += len(await process_documents(batch))
+                latencies.append(time.perf_counter() - started)
+            stages.append(summarize("extract", len(doc_ids), time.perf_counter() - start, latencies, options["extract_batch"]))
+            stages[-1]["failed"] = failed
+
+            latencies = []
+            db = SessionLocal()
+            try:
+                start = time.perf_counter()
+                for query in chat_queries:
+                    started = time.perf_counter()
+                    await chatbot.chat(query, db)
+                    latencies.append(time.perf_counter() - started)
+                stages.append(summarize("chat", len(chat_queries), time.perf_counter() - start, latencies, 1))
+                stages[-1]["cache"] = chatbot.cache.stats()
+            finally:
+                db.close()
+                await ollama_client.close()
+
+        asyncio.run(llm_stages())
+
+        return {
+            "corpus_size": size,
+            "pdf_share": options["pdf_share"],
+            "embedding_model": resolve_model_name(),
+            "stages": stages,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    finally:
+        os.chdir(options["cwd"])
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="corpus sizes to run")
+    parser.add_argument("--pdf-share", type=float, default=0.5, help="fraction of documents written as PDF")
+    parser.add_argument("--batch-size", type=int, default=32, help="files per parse, embed and upload call")
+    parser.add_argument("--extract-docs", type=int, default=256, help="documents sent through extraction")
+    parser.add_argument("--extract-batch", type=int, default=16, help="documents per process_documents call")
+    parser.add_argument("--queries", type=int, default=200, help="search queries")
+    parser.add_argument("--chat-queries", type=int, default=50, help="chat queries")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="stub seconds between streamed tokens")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    server, ollama_host = start_stub(latency=args.latency, token_delay=args.token_delay)
+    options = {
+        "ollama_host": ollama_host,
+        "pdf_share": args.pdf_share,
+        "batch_size": args.batch_size,
+        "extract_docs": args.extract_docs,
+        "extract_batch": args.extract_batch,
+        "queries": args.queries,
+        "chat_queries": args.chat_queries,
+        "seed": args.seed,
+        "cwd": os.getcwd(),
+    }
+    runs = []
+    try:
+        for size in args.sizes:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                runs.append(pool.submit(run_size, size, options).result())
+    finally:
+        server.shutdown()
+
+    print(f"{'size':>7} {'stage':<8} {'items':>7} {'seconds':>9} {'per sec':>9} {'p50 ms':>9} {'p95 ms':>9} {'rss MB':>8}")
+    for run in runs:
+        for s in run["stages"]:
+            print(
+                f"{run['corpus_size']:>7} {s['stage']:<8} {s['items']:>7} {s['seconds']:>9} "
+                f"{s['per_sec']!s:>9} {s['p50_ms']!s:>9} {s['p95_ms']!s:>9} {s['peak_rss_mb']:>8}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "created_at": datetime.utcnow().isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "stub": {"latency": args.latency, "token_delay": args.token_delay},
+                "runs": runs,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
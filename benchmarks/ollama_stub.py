@@ -0,0 +1,189 @@
+"""Minimal stand-in for the Ollama HTTP API, for tests and benchmarks.
+
+    python -m benchmarks.ollama_stub --port 11435 --latency 0.5 --token-delay 0.01
+    OLLAMA_HOST=http://127.0.0.1:11435 uvicorn app.main:app
+
+Implements /api/generate (streaming and not), /api/tags and /api/version.
+Extraction prompts (single, multi-document or typed) get a plausible
+classification built from keywords in the document text; every other
+prompt gets {"response": []}. Replies carry
+the same timing and token-count fields Ollama reports.
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+
+DATE = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+AMOUNT = re.compile(r"(?:total|amount due|amount)[^\d\n]{0,20}([\d,]+(?:\.\d+)?)", re.IGNORECASE)
+EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+")
+
+
+def _field(pattern: re.Pattern, text: str, default=None):
+    match = pattern.search(text)
+    return match.group(match.lastindex or 0) if match else default
+
+
+def fake_extraction(prompt: str) -> Dict[str, object]:
+    text = prompt.split("Text to process:", 1)[-1]
+    lowered = text.lower()
+    amount = _field(AMOUNT, text)
+    amount = float(amount.replace(",", "")) if amount else None
+    if "invoice" in lowered:
+        return {"document_type": "Invoice", "extracted_data": {
+            "invoice_number": _field(re.compile(r"invoice\s*(?:no\.?|number|#)?\s*[:#]?\s*(\w+)", re.I), text),
+            "date": _field(DATE, text),
+            "company": "Stub Vendor",
+            "total_amount": amount,
+        }}
+    if "kwh" in lowered or "utility" in lowered or "account number" in lowered:
+        return {"document_type": "Utility Bill", "extracted_data": {
+            "account_number": _field(re.compile(r"account\s*(?:no\.?|number)?\s*[:#]?\s*([\w-]+)", re.I), text),
+            "date": _field(DATE, text),
+            "usage_kwh": _field(re.compile(r"([\d,]+)\s*kwh", re.I), text),
+            "amount_due": amount,
+        }}
+    if "experience" in lowered or "resume" in lowered or "education" in lowered:
+        return {"document_type": "Resume", "extracted_data": {
+            "name": text.strip().splitlines()[1].strip() if len(text.strip().splitlines()) > 1 else None,
+            "email": _field(EMAIL, text),
+            "phone": None,
+            "experience_years": 3,
+        }}
+    return {"document_type": "Other", "extracted_data": {"summary": " ".join(text.split()[:20])}}
+
+
+def fake_batch_extraction(prompt: str) -> Dict[str, object]:
+    documents = []
+    for section in prompt.split("Documents to process:", 1)[-1].split("Document ID: ")[1:]:
+        doc_id, _, text = section.partition("\n")
+        documents.append({"document_id": doc_id.strip(), **fake_extraction("Text to process:" + text)})
+    return {"documents": documents}
+
+
+def reply_for(prompt: str) -> str:
+    if "Documents to process:" in prompt:
+        return json.dumps(fake_batch_extraction(prompt))
+    if "REQUIRED EXTRACTION SCHEMAS" in prompt:
+        return json.dumps(fake_extraction(prompt))
+    if "has been classified as" in prompt:
+        # Typed prompts ask for the fields alone.
+        return json.dumps(fake_extraction(prompt)["extracted_data"])
+    return json.dumps({"response": []})
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    token_delay = 0.0
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload: Dict[str, object], status: int = 200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/version":
+            self._send_json({"version": "0.0.0-stub"})
+        elif self.path == "/api/tags":
+            self._send_json({"models": []})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        try:
+            self._generate()
+        except (BrokenPipeError, ConnectionResetError):
+            # Client gave up (e.g. a timeout test); nothing to report.
+            pass
+
+    def _generate(self):
+        if self.path != "/api/generate":
+            self._send_json({"error": "not found"}, 404)
+            return
+
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        model, prompt = request.get("model", ""), request.get("prompt", "")
+        text = reply_for(prompt)
+        started = time.perf_counter_ns()
+        time.sleep(self.latency)
+        prompt_done = time.perf_counter_ns()
+
+        tokens = [text[i:i + 4] for i in range(0, len(text), 4)]
+        final = {
+            "model": model,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": max(len(prompt) // 4, 1),
+            "prompt_eval_duration": prompt_done - started,
+            "eval_count": len(tokens),
+        }
+
+        if not request.get("stream", True):
+            time.sleep(self.token_delay * len(tokens))
+            now = time.perf_counter_ns()
+            final.update(response=text, eval_duration=now - prompt_done, total_duration=now - started)
+            self._send_json(final)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in tokens:
+            time.sleep(self.token_delay)
+            self._write_chunk({"model": model, "created_at": final["created_at"], "response": token, "done": False})
+        now = time.perf_counter_ns()
+        final.update(response="", eval_duration=now - prompt_done, total_duration=now - started)
+        self._write_chunk(final)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, payload: Dict[str, object]):
+        data = (json.dumps(payload) + "\n").encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def start_stub(host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, token_delay: float = 0.0) -> Tuple[ThreadingHTTPServer, str]:
+    # Serves from a daemon thread; returns the server (call shutdown() when
+    # done) and its base URL, suitable for OLLAMA_HOST.
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"latency": latency, "token_delay": token_delay})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed tokens")
+    args = parser.parse_args(argv)
+
+    server, url = start_stub(args.host, args.port, args.latency, args.token_delay)
+    print(f"Stub Ollama listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Compare PDF text engines on a directory of sample PDFs.
+
+    python -m benchmarks.pdf_backends path/to/pdfs [--backends pdfplumber pypdfium2 pypdf]
+
+For each engine it reports throughput in pages/sec and how closely its text
+matches pdfplumber's (word-multiset overlap, 1.0 = the same words).
+"""
+import argparse
+import json
+import sys
+import time
+from collections import Counter
+from typing import Dict, List
+
+from app.services.pdf_backends import BACKENDS, get_backend
+from app.utils.helpers import get_all_files
+
+
+def word_overlap(a: str, b: str) -> float:
+    words_a, words_b = Counter(a.split()), Counter(b.split())
+    union = sum((words_a | words_b).values())
+    return sum((words_a & words_b).values()) / union if union else 1.0
+
+
+def cell(value) -> str:
+    # Table cell; "-" for metrics a failed or unavailable backend lacks.
+    return "-" if value is None else str(value)
+
+
+def run_backend(name: str, files: List[str]) -> Dict[str, object]:
+    backend = get_backend(name)
+    texts, pages, errors = {}, 0, 0
+    start = time.perf_counter()
+    for path in files:
+        try:
+            count = backend.page_count(path)
+            texts[path] = "\n".join(backend.extract_pages(path, 0, count))
+            pages += count
+        except Exception:
+            errors += 1
+    elapsed = time.perf_counter() - start
+    return {
+        "backend": name,
+        "files": len(files),
+        "pages": pages,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(pages / elapsed, 2) if elapsed else None,
+        "texts": texts,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="directory of sample PDFs")
+    parser.add_argument("--backends", nargs="+", default=sorted(BACKENDS), choices=sorted(BACKENDS))
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    files = get_all_files(args.corpus, [".pdf"])
+    if not files:
+        parser.error(f"no PDFs found in {args.corpus}")
+
+    reference = run_backend("pdfplumber", files)
+    reference_texts = reference["texts"]
+    results = []
+    for name in args.backends:
+        result = reference if name == "pdfplumber" else run_backend(name, files)
+        texts = result.pop("texts")
+        scores = [word_overlap(reference_texts[path], texts[path]) for path in texts if path in reference_texts]
+        result["mean_overlap"] = round(sum(scores) / len(scores), 4) if scores else None
+        result["min_overlap"] = round(min(scores), 4) if scores else None
+        results.append(result)
+
+    print(f"{'backend':<12} {'pages':>7} {'seconds':>9} {'pages/s':>9} {'overlap':>8} {'min':>7}")
+    for r in results:
+        print(
+            f"{r['backend']:<12} {r['pages']:>7} {r['seconds']:>9} {cell(r['pages_per_sec']):>9} "
+            f"{cell(r['mean_overlap']):>8} {cell(r['min_overlap']):>7}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""Measure how long a fresh API worker takes to import, go live and be ready.
+
+    python -m benchmarks.startup [--runs 5] [--documents 10000] [--warmup]
+
+Each run copies a database seeded with --documents random embeddings into a
+fresh directory, then times:
+
+- import:  `import app.main` in a new interpreter;
+- live:    from launching uvicorn until GET /api/health answers;
+- ready:   from launching uvicorn until GET /api/health/ready returns 200,
+           i.e. startup loading (the embedding model with --warmup) is done.
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed_database(path: str, documents: int):
+    # Runs in a child interpreter, since app.database reads DATABASE_URL on
+    # import.
+    code = f"""
+import uuid
+import numpy as np
+from sqlalchemy import insert
+from app.database import Document, EMBEDDING_DIM, SessionLocal, init_db
+from app.services.embeddings import resolve_model_name
+
+init_db()
+rng = np.random.default_rng(0)
+model = resolve_model_name()
+db = SessionLocal()
+for start in range(0, {documents}, 1000):
+    count = min(1000, {documents} - start)
+    vectors = rng.standard_normal((count, EMBEDDING_DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    db.execute(insert(Document), [
+        {{"id": str(uuid.uuid4()), "document_name": f"doc_{{start + i}}.txt", "content": f"document {{start + i}}",
+          "vector_embeddings": vector.tobytes(), "embedding_model": model}}
+        for i, vector in enumerate(vectors)
+    ])
+    db.commit()
+db.close()
+"""
+    subprocess.run([sys.executable, "-c", code], env=_env(path), cwd=os.path.dirname(path), check=True)
+
+
+def _env(db_path: str, warmup: bool = False) -> Dict[str, str]:
+    return {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])),
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "EMBEDDING_WARMUP": "true" if warmup else "false",
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _status(url: str) -> Optional[int]:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def wait_for(url: str, started: float, process: subprocess.Popen, timeout: float, status: int = 200) -> float:
+    while _status(url) != status:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        if time.perf_counter() - started > timeout:
+            raise TimeoutError(f"{url} did not return {status} within {timeout}s")
+        time.sleep(0.01)
+    return time.perf_counter() - started
+
+
+def run_once(template: str, warmup: bool, timeout: float) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "bench.db")
+        shutil.copy(template, db_path)
+        env = _env(db_path, warmup)
+
+        output = subprocess.run(
+            [sys.executable, "-c", "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"],
+            env=env, cwd=workdir, check=True, capture_output=True, text=True,
+        ).stdout
+        import_seconds = float(output.strip().splitlines()[-1])
+
+        port = _free_port()
+        base = f"http://127.0.0.1:{port}/api"
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+            env=env, cwd=workdir,
+        )
+        try:
+            live = wait_for(f"{base}/health", started, process, timeout)
+            ready = wait_for(f"{base}/health/ready", started, process, timeout)
+        finally:
+            process.terminate()
+            process.wait()
+
+    return {"import": import_seconds, "live": live, "ready": ready}
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {"median": round(statistics.median(values), 3), "max": round(max(values), 3)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--documents", type=int, default=10000, help="documents in the database")
+    parser.add_argument("--warmup", action="store_true", help="load the embedding model at startup (EMBEDDING_WARMUP)")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for each server")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template.db")
+        seed_database(template, args.documents)
+        runs = [run_once(template, args.warmup, args.timeout) for _ in range(args.runs)]
+
+    results = {
+        "documents": args.documents,
+        "warmup": args.warmup,
+        "runs": runs,
+        **{name: summarize([run[name] for run in runs]) for name in ("import", "live", "ready")},
+    }
+
+    print(f"{'':<8} {'median s':>9} {'max s':>9}")
+    for name in ("import", "live", "ready"):
+        print(f"{name:<8} {results[name]['median']:>9} {results[name]['max']:>9}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())